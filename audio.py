@@ -0,0 +1,251 @@
+import math
+import re
+import shutil
+import subprocess
+from typing import TYPE_CHECKING, Literal, Optional
+
+import numpy as np
+from groq import Groq
+
+import metrics
+
+if TYPE_CHECKING:
+    from llm import InferenceEngine
+
+SAMPLE_RATE = 16_000
+# Energy is measured over 30 ms windows when looking for a quiet place to cut
+_ENERGY_WINDOW = SAMPLE_RATE * 30 // 1000
+
+def ffmpeg_executable() -> str:
+    """The ffmpeg bundled with moviepy (via imageio-ffmpeg), else the one on PATH."""
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except (ImportError, RuntimeError):
+        path = shutil.which("ffmpeg")
+        if path is None:
+            raise RuntimeError("ffmpeg not found; install imageio-ffmpeg or put ffmpeg on PATH")
+        return path
+
+class NoAudioTrackError(ValueError):
+    """The video has no audio stream to transcribe."""
+
+def extract_audio(video_path: str, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    Decode a video's first audio track to mono 16-bit PCM in memory, without temp
+    files. Only the audio stream is decoded; video packets are skipped by the demuxer.
+
+    Raises:
+        NoAudioTrackError: The video has no audio stream, or it is empty.
+    """
+    with metrics.stage("audio_extract"):
+        result = subprocess.run(
+            # "?" makes the map optional, so a silent video isn't an input error
+            [ffmpeg_executable(), "-v", "error", "-nostdin", "-i", video_path,
+             "-map", "0:a:0?", "-vn", "-ac", "1", "-ar", str(sample_rate), "-f", "s16le", "-"],
+            capture_output=True,
+        )
+    stderr = result.stderr.decode(errors="replace").strip()
+    if result.returncode != 0:
+        # With no audio stream mapped, ffmpeg refuses to write an empty output
+        if "does not contain any stream" in stderr:
+            raise NoAudioTrackError(f"{video_path} has no audio track")
+        raise IOError(f"Cannot extract audio from {video_path}: {stderr}")
+    if not result.stdout:
+        raise NoAudioTrackError(f"{video_path} has no audio track")
+    return np.frombuffer(result.stdout, dtype=np.int16)
+
+class AudioChunk:
+    """A slice of the audio track; `start` and `end` are in seconds from the start of the video."""
+
+    def __init__(self, samples: np.ndarray, start: float, end: float, sample_rate: int = SAMPLE_RATE):
+        self.samples = samples
+        self.start = start
+        self.end = end
+        self.sample_rate = sample_rate
+
+    def __repr__(self) -> str:
+        return f"AudioChunk({self.start:.2f}-{self.end:.2f}s)"
+
+def _quietest_point(samples: np.ndarray, lo: int, hi: int) -> int:
+    """Sample index of the quietest 30 ms window in samples[lo:hi]."""
+    span = samples[lo:hi].astype(np.float32)
+    windows = len(span) // _ENERGY_WINDOW
+    if windows < 2:
+        return hi
+    energy = np.square(span[: windows * _ENERGY_WINDOW]).reshape(windows, _ENERGY_WINDOW).mean(axis=1)
+    return lo + int(np.argmin(energy)) * _ENERGY_WINDOW + _ENERGY_WINDOW // 2
+
+def split_audio(
+    samples: np.ndarray,
+    chunk_seconds: float = 120.0,
+    overlap_seconds: float = 2.0,
+    split: Literal["silence", "fixed"] = "silence",
+    search_seconds: float = 10.0,
+    sample_rate: int = SAMPLE_RATE,
+) -> list[AudioChunk]:
+    """
+    Split PCM audio into chunks of about `chunk_seconds`.
+
+    Args:
+        split (str): "fixed" cuts every `chunk_seconds`. "silence" cuts at the quietest
+            point in the last `search_seconds` before each boundary, so words are rarely
+            split in two.
+        overlap_seconds (float): Every chunk but the first also starts this much before
+            its cut, so speech at the cut is heard by both chunks. `merge_segments`
+            removes the duplicated text.
+
+    Raises:
+        ValueError: Unless `chunk_seconds` > 0 and 0 <= `overlap_seconds` < `chunk_seconds`.
+    """
+    # A chunk must hold at least one sample, or the cut loop would never advance
+    if not (math.isfinite(chunk_seconds) and chunk_seconds * sample_rate >= 1):
+        raise ValueError(f"chunk_seconds must be positive, got {chunk_seconds}")
+    if not 0 <= overlap_seconds < chunk_seconds:
+        raise ValueError(f"overlap_seconds must be at least 0 and less than chunk_seconds, got {overlap_seconds}")
+    chunk_len = int(chunk_seconds * sample_rate)
+    overlap = int(overlap_seconds * sample_rate)
+    search = min(int(search_seconds * sample_rate), chunk_len // 2)
+
+    cuts = [0]
+    while len(samples) - cuts[-1] > chunk_len:
+        boundary = cuts[-1] + chunk_len
+        if split == "silence":
+            boundary = _quietest_point(samples, boundary - search, boundary)
+        elif split != "fixed":
+            raise ValueError(f"Unsupported split mode: {split}")
+        cuts.append(boundary)
+    cuts.append(len(samples))
+
+    chunks = []
+    for i, (cut_start, cut_end) in enumerate(zip(cuts, cuts[1:])):
+        start = cut_start if i == 0 else max(0, cut_start - overlap)
+        chunks.append(AudioChunk(samples[start:cut_end], start / sample_rate, cut_end / sample_rate, sample_rate))
+    return chunks
+
+def encode_chunk(chunk: AudioChunk, codec: Literal["flac", "ogg", "mp3"] = "flac") -> tuple[str, bytes]:
+    """Compress a chunk in memory for upload; returns (file name, encoded bytes)."""
+    codec_args = {
+        "flac": ["-c:a", "flac", "-f", "flac"],
+        "ogg": ["-c:a", "libopus", "-b:a", "24k", "-f", "ogg"],
+        "mp3": ["-c:a", "libmp3lame", "-b:a", "32k", "-f", "mp3"],
+    }
+    if codec not in codec_args:
+        raise ValueError(f"Unsupported codec: {codec}")
+    with metrics.stage("audio_encode"):
+        result = subprocess.run(
+            [ffmpeg_executable(), "-v", "error", "-nostdin",
+             "-f", "s16le", "-ac", "1", "-ar", str(chunk.sample_rate), "-i", "-",
+             *codec_args[codec], "-"],
+            input=chunk.samples.tobytes(),
+            capture_output=True,
+        )
+    if result.returncode != 0:
+        raise IOError(f"Cannot encode audio chunk: {result.stderr.decode(errors='replace').strip()}")
+    return f"chunk_{chunk.start:.2f}.{codec}", result.stdout
+
+def _words(text: str) -> list[str]:
+    return re.sub(r"[^\w\s']", "", text.lower()).split()
+
+def _strip_repeated_prefix(previous: str, text: str, max_words: int = 20) -> str:
+    """Drop the leading words of `text` that repeat the trailing words of `previous`."""
+    prev_words = _words(previous)[-max_words:]
+    words = text.split()
+    normalized = [_words(word) for word in words[:max_words]]
+    for n in range(min(len(prev_words), len(normalized)), 0, -1):
+        if [w for word in normalized[:n] for w in word] == prev_words[-n:]:
+            return " ".join(words[n:])
+    return text
+
+def merge_segments(chunks: list[AudioChunk], chunk_segments: list[list[dict]]) -> list[dict]:
+    """
+    Stitch per-chunk Whisper segments into one timeline.
+
+    Segment times are shifted by their chunk's start. Where two chunks overlap, the
+    earlier chunk's segments are kept up to the middle of the overlap, since speech
+    near a chunk's end may be cut off. The later chunk then contributes only what
+    ends after the last kept segment, minus any words repeated across the seam.
+    """
+    merged: list[dict] = []
+    for i, (chunk, segments) in enumerate(zip(chunks, chunk_segments)):
+        next_seam = (chunks[i + 1].start + chunk.end) / 2 if i + 1 < len(chunks) else float("inf")
+        first_in_chunk = True
+        for segment in segments:
+            start = round(chunk.start + float(segment["start"]), 3)
+            end = round(chunk.start + float(segment["end"]), 3)
+            if start >= next_seam:
+                continue
+            text = segment["text"].strip()
+            if first_in_chunk and merged:
+                if end <= merged[-1]["end"]:
+                    # Already covered by the previous chunk
+                    continue
+                text = _strip_repeated_prefix(merged[-1]["text"], text)
+                start = max(start, merged[-1]["end"])
+            first_in_chunk = False
+            if text:
+                merged.append({"start": start, "end": end, "text": text})
+    return merged
+
+class AudioTranscriber:
+    """
+    Transcribes a video's audio track with Whisper on Groq.
+
+    The audio is extracted to memory as 16 kHz mono, split into chunks and compressed.
+    The chunks are transcribed concurrently on `engine`, and their segments are
+    stitched back into one timeline.
+    """
+
+    def __init__(
+        self,
+        client: Groq,
+        engine: "InferenceEngine",
+        model: str = "whisper-large-v3",
+        language: Optional[str] = "en",
+        prompt: Optional[str] = None,
+        chunk_seconds: float = 120.0,
+        overlap_seconds: float = 2.0,
+        split: Literal["silence", "fixed"] = "silence",
+        codec: Literal["flac", "ogg", "mp3"] = "flac",
+    ):
+        self.client = client
+        self.engine = engine
+        self.model = model
+        self.language = language
+        self.prompt = prompt
+        self.chunk_seconds = chunk_seconds
+        self.overlap_seconds = overlap_seconds
+        self.split = split
+        self.codec = codec
+
+    def transcribe_chunk(self, chunk: AudioChunk) -> list[dict]:
+        filename, data = encode_chunk(chunk, self.codec)
+        kwargs: dict = {}
+        if self.language:
+            kwargs["language"] = self.language
+        if self.prompt:
+            kwargs["prompt"] = self.prompt
+        with metrics.stage("transcribe"):
+            transcription = self.client.audio.transcriptions.create(
+                file=(filename, data),
+                model=self.model,
+                response_format="verbose_json",
+                timestamp_granularities=["segment"],
+                temperature=0.0,
+                **kwargs,
+            )
+        segments = getattr(transcription, "segments", None) or []
+        return [segment if isinstance(segment, dict) else segment.model_dump() for segment in segments]
+
+    def transcribe_samples(self, samples: np.ndarray) -> list[dict]:
+        chunks = split_audio(samples, self.chunk_seconds, self.overlap_seconds, self.split)
+        print(f"Transcribing {len(chunks)} audio chunks...")
+        chunk_segments = self.engine.map(self.transcribe_chunk, chunks)
+        return merge_segments(chunks, chunk_segments)
+
+    def transcribe(self, video_path: str) -> list[dict]:
+        """
+        Returns:
+            list: Segments as {"start", "end", "text"}, with times in seconds from the start of the video.
+        """
+        return self.transcribe_samples(extract_audio(video_path))
@@ -0,0 +1,78 @@
+"""
+Decode throughput of the OpenCV seek loop vs. the PyAV backend (PyAVVideoFrameSampler).
+
+Run from the repository root:
+    python -m benchmarks.bench_decoder [--video sample_data/sample_vid.mp4] [--every-n-seconds 2] [--max-side 640]
+
+Rows produce frames no larger than --max-side, as the encoder would need them: OpenCV
+rows decode at full size and resize afterwards, "scaled" PyAV rows scale in swscale.
+The "full size" PyAV rows skip scaling so "identical" can compare their frames with
+OpenCV's in the same decode mode. "speedup" compares frames/s with the cv2 seek loop.
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from videoparser import FrameEncoder, PyAVVideoFrameSampler, VideoFrameSampler
+
+
+def time_decode(sampler: VideoFrameSampler, every_n_seconds: float, decode_mode: str, max_side: int) -> tuple[float, list]:
+    start = time.perf_counter()
+    frames = [
+        (frame_idx, frame if isinstance(sampler, PyAVVideoFrameSampler) else FrameEncoder._resize(frame, max_side))
+        for frame_idx, frame in sampler._iter_raw_frames(every_n_seconds, None, decode_mode)
+    ]
+    return time.perf_counter() - start, frames
+
+
+def identical(frames: list, baseline: list) -> bool:
+    return len(frames) == len(baseline) and all(
+        idx == base_idx and np.array_equal(frame, base_frame)
+        for (idx, frame), (base_idx, base_frame) in zip(frames, baseline)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", default="sample_data/sample_vid.mp4")
+    parser.add_argument("--every-n-seconds", type=float, default=2.0)
+    parser.add_argument("--max-side", type=int, default=640)
+    parser.add_argument("--threads", type=int, default=0, help="PyAV decoder threads (0: one per CPU)")
+    args = parser.parse_args()
+
+    def pyav(**kwargs) -> PyAVVideoFrameSampler:
+        return PyAVVideoFrameSampler(args.video, threads=args.threads, **kwargs)
+
+    baseline_time, baseline = time_decode(VideoFrameSampler(args.video), args.every_n_seconds, "seek", args.max_side)
+    print(
+        f"{len(baseline)} frames every {args.every_n_seconds}s from {args.video} at max side {args.max_side} "
+        f"on {os.cpu_count()} CPUs\n"
+    )
+    print(f"{'decoder':<32} {'frames':>7} {'seconds':>9} {'frames/s':>10} {'speedup':>9} {'identical':>10}")
+    print(
+        f"{'cv2 seek':<32} {len(baseline):>7} {baseline_time:>9.2f} {len(baseline) / baseline_time:>10.1f} "
+        f"{1.0:>9.2f} {'-':>10}"
+    )
+
+    full_size = {mode: VideoFrameSampler(args.video)._iter_raw_frames(args.every_n_seconds, None, mode) for mode in ("seek", "sequential")}
+    rows = [
+        ("cv2 sequential", VideoFrameSampler(args.video), "sequential", None),
+        ("pyav seek, full size", pyav(), "seek", "seek"),
+        ("pyav sequential, full size", pyav(), "sequential", "sequential"),
+        ("pyav seek, scaled", pyav(max_side=args.max_side), "seek", None),
+        ("pyav sequential, scaled", pyav(max_side=args.max_side), "sequential", None),
+        ("pyav keyframes only, scaled", pyav(max_side=args.max_side, keyframes_only=True), "auto", None),
+    ]
+    for name, sampler, decode_mode, compare_mode in rows:
+        elapsed, frames = time_decode(sampler, args.every_n_seconds, decode_mode, args.max_side)
+        same = str(identical(frames, list(full_size[compare_mode]))) if compare_mode else "-"
+        print(
+            f"{name:<32} {len(frames):>7} {elapsed:>9.2f} {len(frames) / elapsed:>10.1f} "
+            f"{baseline_time / elapsed * len(frames) / len(baseline):>9.2f} {same:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Bytes per frame and encode time per frame for the old PIL path vs. FrameEncoder settings.
+
+Run from the repository root:
+    python -m benchmarks.bench_encoding [--video sample_data/sample_vid.mp4] [--simulate-4k]
+"""
+import argparse
+import time
+
+import cv2
+
+from videoparser import FrameEncoder, VideoFrameSampler
+
+
+def legacy_encode(frame_bgr) -> str:
+    """The original BGR -> PIL -> JPEG -> base64 path."""
+    return VideoFrameSampler._pil_to_base64(VideoFrameSampler._cv2_to_pil(frame_bgr))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", default="sample_data/sample_vid.mp4")
+    parser.add_argument("--every-n-seconds", type=float, default=1.0)
+    parser.add_argument("--max-frames", type=int, default=30)
+    parser.add_argument("--simulate-4k", action="store_true", help="Upscale frames to 3840x2160 to mimic phone footage")
+    args = parser.parse_args()
+
+    sampler = VideoFrameSampler(args.video)
+    frames = [frame for _, frame in sampler._iter_raw_frames(args.every_n_seconds, args.max_frames)]
+    if args.simulate_4k:
+        frames = [cv2.resize(frame, (3840, 2160), interpolation=cv2.INTER_CUBIC) for frame in frames]
+    h, w = frames[0].shape[:2]
+    print(f"{len(frames)} frames at {w}x{h} from {args.video}\n")
+
+    configs = {
+        "PIL JPEG (old path)": None,
+        "cv2 JPEG q75": FrameEncoder(),
+        "cv2 JPEG q80 max 1280": FrameEncoder(max_side=1280, quality=80),
+        "cv2 JPEG q70 max 768": FrameEncoder(max_side=768, quality=70),
+        "cv2 WebP q80 max 1280": FrameEncoder(max_side=1280, codec="webp", quality=80),
+        "cv2 JPEG max 1280 <=150KB": FrameEncoder(max_side=1280, quality=85, max_bytes=150_000),
+    }
+
+    print(f"{'config':<28} {'KB/frame':>10} {'b64 KB/frame':>13} {'ms/frame':>10}")
+    for name, encoder in configs.items():
+        start = time.perf_counter()
+        if encoder is None:
+            payloads = [legacy_encode(frame) for frame in frames]
+            raw_sizes = [len(payload) * 3 / 4 for payload in payloads]
+            b64_sizes = [len(payload) for payload in payloads]
+        else:
+            encoded = [encoder.encode(frame) for frame in frames]
+            b64_sizes = [len(frame.base64) for frame in encoded]
+            raw_sizes = [len(frame) for frame in encoded]
+        elapsed_ms = (time.perf_counter() - start) * 1000 / len(frames)
+        print(
+            f"{name:<28} {sum(raw_sizes) / len(frames) / 1024:>10.1f} "
+            f"{sum(b64_sizes) / len(frames) / 1024:>13.1f} {elapsed_ms:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Decode throughput of VideoFrameSampler vs. ParallelVideoFrameSampler by worker count.
+
+Run from the repository root:
+    python -m benchmarks.bench_parallel_decode [--video sample_data/sample_vid.mp4] [--workers 1 2 4 8]
+
+The sample video is short, so process start-up is a visible share of the parallel
+timings; the speedup grows with video length.
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from videoparser import ParallelVideoFrameSampler, VideoFrameSampler
+
+
+def time_decode(sampler: VideoFrameSampler, every_n_seconds: float, decode_mode: str) -> tuple[float, list]:
+    start = time.perf_counter()
+    frames = list(sampler._iter_raw_frames(every_n_seconds, None, decode_mode))
+    return time.perf_counter() - start, frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", default="sample_data/sample_vid.mp4")
+    parser.add_argument("--every-n-seconds", type=float, default=0.5)
+    parser.add_argument("--decode-mode", choices=["auto", "seek", "sequential"], default="auto")
+    parser.add_argument("--frames-per-task", type=int, default=32)
+    parser.add_argument(
+        "--workers", type=int, nargs="+",
+        default=sorted({1, 2, 4, os.cpu_count() or 1}),
+        help="Worker counts to try (default: 1, 2, 4 and the CPU count)",
+    )
+    args = parser.parse_args()
+
+    baseline_time, baseline = time_decode(VideoFrameSampler(args.video), args.every_n_seconds, args.decode_mode)
+    print(f"{len(baseline)} frames every {args.every_n_seconds}s from {args.video} on {os.cpu_count()} CPUs\n")
+    print(f"{'sampler':<24} {'seconds':>9} {'frames/s':>10} {'speedup':>9} {'identical':>10}")
+    print(f"{'VideoFrameSampler':<24} {baseline_time:>9.2f} {len(baseline) / baseline_time:>10.1f} {1.0:>9.2f} {'-':>10}")
+
+    for workers in args.workers:
+        sampler = ParallelVideoFrameSampler(args.video, workers=workers, frames_per_task=args.frames_per_task)
+        elapsed, frames = time_decode(sampler, args.every_n_seconds, args.decode_mode)
+        identical = len(frames) == len(baseline) and all(
+            idx == base_idx and np.array_equal(frame, base_frame)
+            for (idx, frame), (base_idx, base_frame) in zip(frames, baseline)
+        )
+        print(
+            f"{f'parallel x{workers}':<24} {elapsed:>9.2f} {len(frames) / elapsed:>10.1f} "
+            f"{baseline_time / elapsed:>9.2f} {str(identical):>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
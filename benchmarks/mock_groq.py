@@ -0,0 +1,296 @@
+"""
+Local stand-in for the Groq chat-completions, files and batches endpoints.
+
+Point the app at it with GROQ_BASE_URL=http://127.0.0.1:<port>; both the Groq SDK and
+GroqBatchManager honour it. Latency, per-key rate limits and error rates are
+configurable, and every request is counted so benchmarks can report calls and bytes.
+
+Run standalone from the repository root:
+    python -m benchmarks.mock_groq [--port 8765] [--latency 0.3] [--rpm 600] [--error-rate 0.0]
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Optional
+
+from flask import Flask, Response, jsonify, request
+from werkzeug.serving import make_server
+
+
+class MockGroqServer:
+    """
+    Args:
+        latency (float): Mean seconds per chat completion.
+        jitter (float): Latency varies uniformly by +/- this many seconds.
+        requests_per_minute (int): Per-key limit; excess requests get a 429.
+        error_rate (float): Fraction of chat completions (and batch items) that fail with a 500.
+        yes_rate (float): Fraction of images answered "Yes". Answers are a pure function
+            of the image, so repeated runs see the same replies.
+        batch_latency (float): Seconds before a submitted batch completes.
+        seed (int): Seed for latency jitter and injected errors.
+        quiet (bool): Drop the per-request access log.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.3,
+        jitter: float = 0.1,
+        requests_per_minute: int = 600,
+        error_rate: float = 0.0,
+        yes_rate: float = 0.3,
+        batch_latency: float = 2.0,
+        seed: int = 0,
+        quiet: bool = True,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.requests_per_minute = requests_per_minute
+        self.error_rate = error_rate
+        self.yes_rate = yes_rate
+        self.batch_latency = batch_latency
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._windows: dict[str, deque[float]] = {}
+        self.files: dict[str, str] = {}
+        self.batches: dict[str, dict] = {}
+        self.reset()
+        self.app = self._create_app()
+        if quiet:
+            logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        self._server = make_server(host, port, self.app, threaded=True)
+        self.port = self._server.server_port
+        self.base_url = f"http://{host}:{self.port}"
+        self._thread: Optional[threading.Thread] = None
+
+    def reset(self):
+        with self._lock:
+            self.counters = {"chat_calls": 0, "batch_items": 0, "rate_limited": 0, "errors": 0, "bytes_in": 0}
+            self.call_latencies: list[float] = []
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self.counters, "call_latencies": list(self.call_latencies)}
+
+    def start(self) -> "MockGroqServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def _take_slot(self, api_key: str) -> Optional[float]:
+        """Record a request against the key's one-minute window; seconds to wait if it's full."""
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.setdefault(api_key, deque())
+            while window and now - window[0] >= 60.0:
+                window.popleft()
+            if len(window) >= self.requests_per_minute:
+                return 60.0 - (now - window[0])
+            window.append(now)
+            return None
+
+    def _rate_limit_headers(self, api_key: str, reset: float = 0.0) -> dict:
+        with self._lock:
+            window = self._windows.get(api_key, deque())
+            remaining = max(0, self.requests_per_minute - len(window))
+            if window and not reset:
+                reset = max(0.0, 60.0 - (time.monotonic() - window[0]))
+        return {
+            "x-ratelimit-limit-requests": str(self.requests_per_minute),
+            "x-ratelimit-remaining-requests": str(remaining),
+            "x-ratelimit-reset-requests": f"{reset:.2f}s",
+        }
+
+    def answer(self, body: dict) -> str:
+        """Deterministic Yes/No answer for a chat-completions body."""
+        prompt, image = "", ""
+        for message in body.get("messages", []):
+            for part in message.get("content", []):
+                if part.get("type") == "text":
+                    prompt += part["text"]
+                elif part.get("type") == "image_url":
+                    image += part["image_url"]["url"]
+
+        def yes_or_no(salt: str) -> str:
+            digest = hashlib.sha256((image + salt).encode("utf-8")).digest()
+            return "Yes" if int.from_bytes(digest[:4], "big") / 2**32 < self.yes_rate else "No"
+
+        if "JSON object" in prompt:
+            numbers = re.findall(r"^\s*(\d+)\.", prompt, re.MULTILINE)
+            return json.dumps({number: yes_or_no(number) for number in numbers})
+        return yes_or_no("")
+
+    def completion(self, body: dict) -> dict:
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", ""),
+            "choices": [
+                {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": self.answer(body)}}
+            ],
+            "usage": {"prompt_tokens": 1500, "completion_tokens": 1, "total_tokens": 1501},
+        }
+
+    def _create_app(self) -> Flask:
+        app = Flask(__name__)
+
+        @app.before_request
+        def count_bytes():
+            self._count("bytes_in", request.content_length or 0)
+
+        @app.post("/openai/v1/chat/completions")
+        def chat_completions():
+            api_key = request.headers.get("Authorization", "")
+            wait = self._take_slot(api_key)
+            if wait is not None:
+                self._count("rate_limited")
+                headers = {**self._rate_limit_headers(api_key, wait), "retry-after": f"{wait:.2f}"}
+                return jsonify({"error": {"message": "Rate limit reached", "type": "requests"}}), 429, headers
+
+            start = time.perf_counter()
+            with self._lock:
+                delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+                failed = self.random.random() < self.error_rate
+            time.sleep(delay)
+            with self._lock:
+                self.counters["chat_calls"] += 1
+                self.call_latencies.append(time.perf_counter() - start)
+            if failed:
+                self._count("errors")
+                return jsonify({"error": {"message": "Injected server error", "type": "internal_server_error"}}), 500
+            return jsonify(self.completion(request.get_json())), 200, self._rate_limit_headers(api_key)
+
+        @app.post("/openai/v1/files")
+        def upload_file():
+            upload = request.files["file"]
+            data = upload.read()
+            if upload.filename.endswith(".gz"):
+                data = gzip.decompress(data)
+            file_id = f"file_{uuid.uuid4().hex[:12]}"
+            with self._lock:
+                self.files[file_id] = data.decode("utf-8")
+            return jsonify({"id": file_id, "object": "file", "bytes": len(data), "purpose": "batch"})
+
+        @app.get("/openai/v1/files/<file_id>/content")
+        def file_content(file_id: str):
+            with self._lock:
+                content = self.files.get(file_id)
+            if content is None:
+                return jsonify({"error": {"message": f"No file {file_id}"}}), 404
+            return Response(content, mimetype="application/jsonl")
+
+        @app.post("/openai/v1/batches")
+        def create_batch():
+            body = request.get_json()
+            with self._lock:
+                if body["input_file_id"] not in self.files:
+                    return jsonify({"error": {"message": f"No file {body['input_file_id']}"}}), 404
+                batch_id = f"batch_{uuid.uuid4().hex[:12]}"
+                self.batches[batch_id] = {
+                    "id": batch_id,
+                    "object": "batch",
+                    "status": "validating",
+                    "input_file_id": body["input_file_id"],
+                    "created_at": time.time(),
+                }
+                return jsonify(self.batches[batch_id])
+
+        @app.get("/openai/v1/batches/<batch_id>")
+        def get_batch(batch_id: str):
+            with self._lock:
+                batch = self.batches.get(batch_id)
+            if batch is None:
+                return jsonify({"error": {"message": f"No batch {batch_id}"}}), 404
+            if batch["status"] != "completed":
+                if time.time() - batch["created_at"] >= self.batch_latency:
+                    self._complete_batch(batch)
+                else:
+                    batch["status"] = "in_progress"
+            return jsonify(batch)
+
+        return app
+
+    def _complete_batch(self, batch: dict):
+        with self._lock:
+            lines = [json.loads(line) for line in self.files[batch["input_file_id"]].splitlines() if line.strip()]
+        # Real batches don't preserve input order either
+        self.random.shuffle(lines)
+        output, errors = [], []
+        for line in lines:
+            with self._lock:
+                failed = self.random.random() < self.error_rate
+            if failed:
+                errors.append({
+                    "id": f"batch_req_{uuid.uuid4().hex[:12]}",
+                    "custom_id": line["custom_id"],
+                    "response": {"status_code": 500, "body": {"error": {"message": "Injected server error"}}},
+                    "error": None,
+                })
+            else:
+                output.append({
+                    "id": f"batch_req_{uuid.uuid4().hex[:12]}",
+                    "custom_id": line["custom_id"],
+                    "response": {"status_code": 200, "body": self.completion(line["body"])},
+                    "error": None,
+                })
+        with self._lock:
+            self.counters["batch_items"] += len(lines)
+            self.counters["errors"] += len(errors)
+            batch["output_file_id"] = f"file_{uuid.uuid4().hex[:12]}"
+            self.files[batch["output_file_id"]] = "\n".join(json.dumps(line) for line in output)
+            if errors:
+                batch["error_file_id"] = f"file_{uuid.uuid4().hex[:12]}"
+                self.files[batch["error_file_id"]] = "\n".join(json.dumps(line) for line in errors)
+            batch["request_counts"] = {"total": len(lines), "completed": len(output), "failed": len(errors)}
+            batch["status"] = "completed"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--rpm", type=int, default=600)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--yes-rate", type=float, default=0.3)
+    parser.add_argument("--batch-latency", type=float, default=2.0)
+    args = parser.parse_args()
+
+    server = MockGroqServer(
+        port=args.port,
+        latency=args.latency,
+        jitter=args.jitter,
+        requests_per_minute=args.rpm,
+        error_rate=args.error_rate,
+        yes_rate=args.yes_rate,
+        batch_latency=args.batch_latency,
+        quiet=False,
+    )
+    print(f"Mock Groq API listening on {server.base_url} (GROQ_BASE_URL={server.base_url})")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
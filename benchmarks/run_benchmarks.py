@@ -0,0 +1,216 @@
+"""
+End-to-end pipeline benchmarks against the local Groq stand-in (benchmarks/mock_groq.py).
+
+Drives detection_in_video, detection_in_video_batched, detect_event_in_video,
+detect_event_segments and the /detect and /detect_stream routes on sample_data, with every cache emptied before each
+run. Reports per scenario:
+    - throughput: seconds of video processed per wall-clock second
+    - p50/p95/p99: end-to-end latency of a run, in seconds
+    - calls/video-min: chat completions plus batch items per minute of video
+    - bytes/run: request bytes received by the API
+
+Run from the repository root:
+    python -m benchmarks.run_benchmarks                    # compare with benchmarks/baseline.json
+    python -m benchmarks.run_benchmarks --save-baseline    # record a new baseline
+
+Exits with status 1 when a metric regressed beyond --tolerance against the baseline.
+"""
+import argparse
+import contextlib
+import json
+import os
+from pathlib import Path
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.mock_groq import MockGroqServer
+
+DEFAULT_BASELINE = Path(__file__).with_name("baseline.json")
+MODEL = "meta-llama/llama-4-scout-17b-16e-instruct"
+# Metrics where a larger value is a regression; throughput regresses when it drops
+HIGHER_IS_WORSE = ("p50", "p95", "p99", "calls_per_video_minute", "bytes_per_run")
+
+
+def configure_environment(server: MockGroqServer, workdir: Path, requests_per_minute: int):
+    """Point the app at the mock server and keep every cache inside `workdir`."""
+    os.environ.update({
+        "GROQ_BASE_URL": server.base_url,
+        "GROQ_API_KEY": "mock-key",
+        "GROQ_API_KEYS": "mock-key",
+        "GROQ_REQUESTS_PER_MINUTE": str(requests_per_minute),
+        "GROQ_TOKENS_PER_MINUTE": str(requests_per_minute * 2000),
+        "LLAMAVID_CACHE_PATH": str(workdir / "inference_cache.sqlite3"),
+        "LLAMAVID_VIDEO_STORE": str(workdir / "videos"),
+        "LLAMAVID_FRAME_CACHE": str(workdir / "frames"),
+        "LLAMAVID_JOBS_DB": str(workdir / "jobs.sqlite3"),
+        "LLAMAVID_JOBS_DIR": str(workdir / "jobs"),
+    })
+
+
+def clear_caches(main):
+    main.INFERENCE_CACHE.clear()
+    for path in main.FRAME_CACHE.root.glob("*.pkl"):
+        path.unlink()
+
+
+def build_scenarios(main, app, video_path: str, description: str) -> dict:
+    client = app.app.test_client()
+
+    def post_video(route: str, **form):
+        with open(video_path, "rb") as f:
+            response = client.post(route, data={"video": (f, Path(video_path).name), **form})
+            body = response.get_data()
+        if response.status_code != 200:
+            raise RuntimeError(f"{route} returned {response.status_code}: {body[:200]!r}")
+
+    return {
+        "detection_in_video": lambda: main.detection_in_video(
+            video_path, description, "detection", every_n_seconds=1.0, max_frames=None, model=MODEL
+        ),
+        "detection_in_video_multiframe": lambda: main.detection_in_video(
+            video_path, description, "detection", every_n_seconds=1.0, max_frames=None, model=MODEL, multiframe=True
+        ),
+        "detection_in_video_batched": lambda: main.detection_in_video_batched(
+            video_path, description, "detection", every_n_seconds=1.0, max_frames=None, model=MODEL, batch_size=16
+        ),
+        "detect_event_in_video": lambda: main.detect_event_in_video(
+            video_path, description, every_n_seconds=1.0, max_frames=None, model=MODEL
+        ),
+        "detect_event_segments": lambda: main.detect_event_segments(
+            video_path, description, every_n_seconds=1.0, window_size=4, stride=2, model=MODEL
+        ),
+        "route_detect": lambda: post_video(
+            "/detect", description=description, every_n_seconds="1.0", max_frames="1000"
+        ),
+        "route_detect_stream": lambda: post_video(
+            "/detect_stream", description=description, every_n_seconds="1.0", max_frames="1000"
+        ),
+    }
+
+
+def run_scenario(fn, main, server: MockGroqServer, video_seconds: float, repeat: int, verbose: bool = False) -> dict:
+    durations = []
+    server.reset()
+    for _ in range(repeat):
+        clear_caches(main)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(sys.stdout if verbose else devnull):
+            start = time.perf_counter()
+            fn()
+            durations.append(time.perf_counter() - start)
+    stats = server.stats()
+    calls = stats["chat_calls"] + stats["batch_items"]
+    return {
+        "runs": repeat,
+        "throughput": round(video_seconds * repeat / sum(durations), 3),
+        "p50": round(float(np.percentile(durations, 50)), 3),
+        "p95": round(float(np.percentile(durations, 95)), 3),
+        "p99": round(float(np.percentile(durations, 99)), 3),
+        "calls_per_video_minute": round(calls / repeat / (video_seconds / 60.0), 2),
+        "bytes_per_run": int(stats["bytes_in"] / repeat),
+        "rate_limited": stats["rate_limited"],
+        "errors": stats["errors"],
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for name, metrics in results.items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            continue
+        for metric in HIGHER_IS_WORSE:
+            if base[metric] and metrics[metric] > base[metric] * (1 + tolerance):
+                regressions.append(f"{name}.{metric}: {metrics[metric]} vs baseline {base[metric]}")
+        if metrics["throughput"] < base["throughput"] * (1 - tolerance):
+            regressions.append(f"{name}.throughput: {metrics['throughput']} vs baseline {base['throughput']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", default="sample_data/sample_vid.mp4")
+    parser.add_argument("--description", default="a person")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--scenarios", nargs="+", help="Only run these scenarios")
+    parser.add_argument("--latency", type=float, default=0.3, help="Mock seconds per chat completion")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--rpm", type=int, default=600, help="Mock per-key requests per minute")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--batch-latency", type=float, default=2.0)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative change before flagging")
+    parser.add_argument("--verbose", action="store_true", help="Show the pipeline's own output")
+    args = parser.parse_args()
+
+    server = MockGroqServer(
+        latency=args.latency,
+        jitter=args.jitter,
+        requests_per_minute=args.rpm,
+        error_rate=args.error_rate,
+        batch_latency=args.batch_latency,
+    ).start()
+    workdir = Path(tempfile.mkdtemp(prefix="llamavid_bench_"))
+    try:
+        configure_environment(server, workdir, args.rpm)
+        # Imported only now: both modules read their configuration at import time
+        import app
+        import main as pipeline
+
+        import cv2
+        cap = cv2.VideoCapture(args.video)
+        video_seconds = cap.get(cv2.CAP_PROP_FRAME_COUNT) / cap.get(cv2.CAP_PROP_FPS)
+        cap.release()
+
+        scenarios = build_scenarios(pipeline, app, args.video, args.description)
+        selected = args.scenarios or list(scenarios)
+        results = {}
+        for name in selected:
+            print(f"[~] {name}...", file=sys.stderr)
+            results[name] = run_scenario(scenarios[name], pipeline, server, video_seconds, args.repeat, args.verbose)
+    finally:
+        server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"\n{'scenario':<32} {'video s/s':>9} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'calls/min':>10} {'KB/run':>9}")
+    for name, metrics in results.items():
+        print(
+            f"{name:<32} {metrics['throughput']:>9.2f} {metrics['p50']:>7.2f} {metrics['p95']:>7.2f} "
+            f"{metrics['p99']:>7.2f} {metrics['calls_per_video_minute']:>10.1f} {metrics['bytes_per_run'] / 1024:>9.1f}"
+        )
+
+    config = {
+        "video": args.video,
+        "repeat": args.repeat,
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "rpm": args.rpm,
+        "error_rate": args.error_rate,
+        "batch_latency": args.batch_latency,
+    }
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps({"config": config, "results": results}, indent=2) + "\n")
+        print(f"\nSaved baseline to {args.baseline}")
+        return
+
+    if not args.baseline.exists():
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to record one")
+        return
+    baseline = json.loads(args.baseline.read_text())
+    if baseline.get("config") != config:
+        print(f"\n[!] Baseline was recorded with a different configuration: {baseline.get('config')}")
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print("\n[!] Regressions against baseline:")
+        for regression in regressions:
+            print(f"    {regression}")
+        sys.exit(1)
+    print("\nNo regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
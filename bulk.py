@@ -0,0 +1,256 @@
+"""
+Scan many videos for the same descriptions under one shared inference budget.
+
+    python bulk.py recordings/ --description "a person" --description "a red car" --report scan.jsonl
+
+Each finished video is appended to the JSONL report straight away. Running the same
+command again resumes: videos already in the report with the same settings are skipped.
+"""
+import argparse
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+from pathlib import Path
+import queue
+import threading
+import time
+from typing import Callable, Iterator, Sequence, Union
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".avi", ".mkv", ".webm", ".m4v")
+
+# Marks the end of one video's worker
+_DONE = object()
+
+def find_videos(paths: Sequence[Union[str, Path]], extensions: Sequence[str] = VIDEO_EXTENSIONS) -> list[str]:
+    """Expand directories (recursively) into the video files inside them, keeping files as given."""
+    videos = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            videos.extend(str(p) for p in sorted(path.rglob("*")) if p.is_file() and p.suffix.lower() in extensions)
+        else:
+            videos.append(str(path))
+    # The same file given twice (or via a directory and directly) is scanned once
+    return list(dict.fromkeys(videos))
+
+def video_fingerprint(path: Union[str, Path]) -> dict:
+    """Cheap identity of a file, so a resumed run rescans videos that changed since."""
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+class BulkReport:
+    """
+    JSONL report with one record per finished video, which doubles as the checkpoint
+    of a bulk run. Records are flushed to disk as they are written, so an interrupted
+    run loses at most the videos that were in progress; a line torn by a crash is ignored.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def records(self) -> list[dict]:
+        if not self.path.exists():
+            return []
+        records = []
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+        return records
+
+    def completed(self, config: dict) -> dict[str, dict]:
+        """Successful records made with `config`, by video path. Failed videos are retried."""
+        config = json.loads(json.dumps(config))
+        done = {}
+        for record in self.records():
+            if record.get("status") == "done" and record.get("config") == config:
+                done[record["video"]] = record
+        return done
+
+    def write(self, record: dict):
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            # A torn line from an earlier crash would swallow this record, so start a fresh line
+            if self.path.exists() and self.path.stat().st_size:
+                with open(self.path, "rb") as f:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        line = "\n" + line
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+class BulkRunner:
+    """
+    Runs `analyze` over up to `max_videos` videos at once, so one video is decoded while
+    another waits on inference. `analyze` should submit to a shared `InferenceEngine`
+    and rate-limit through a shared scheduler: concurrency and quota are then one budget
+    for the whole run instead of starting over with every file.
+
+    `analyze(video_path)` yields pipeline events and ends with a "summary" event, whose
+    fields (minus "event") become the video's report record. `run` yields:
+        - {"event": "start", "videos", "skipped"}
+        - every event of `analyze` except its summary, with "video" added
+        - {"event": "video", "video", "status", ...} as each video's record is written,
+          with "status": "failed" and "error" if `analyze` raised
+        - {"event": "summary", "videos", "done", "failed", "skipped", "elapsed"}
+
+    Args:
+        config (dict): Settings that affect results. A report record is only reused
+            when its config matches, so changing a prompt or the sampling rescans.
+    """
+
+    def __init__(
+        self,
+        videos: Sequence[str],
+        analyze: Callable[[str], Iterator[dict]],
+        report: BulkReport,
+        config: dict,
+        max_videos: int = 2,
+        queue_size: int = 64,
+    ):
+        self.videos = list(videos)
+        self.analyze = analyze
+        self.report = report
+        self.config = config
+        self.max_videos = max_videos
+        self._events: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def _put(self, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._events.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _work(self, video_path: str):
+        record = {"video": video_path}
+        started = time.time()
+        try:
+            record.update(video_fingerprint(video_path))
+            events = self.analyze(video_path)
+            summary = {}
+            try:
+                for event in events:
+                    if self._stop.is_set():
+                        return
+                    if event["event"] == "summary":
+                        summary = event
+                    elif not self._put({**event, "video": video_path}):
+                        return
+            finally:
+                events.close()
+            summary = {name: value for name, value in summary.items() if name != "event"}
+            record.update(status="done", **summary)
+        except Exception as e:
+            print(f"[!] {video_path}: {e}")
+            record.update(status="failed", error=str(e))
+        finally:
+            # Written last and only on completion, so an interrupted video is rescanned
+            if not self._stop.is_set():
+                record.update(config=self.config, elapsed=round(time.time() - started, 3))
+                self.report.write(record)
+                self._put({"event": "video", **record})
+            self._put(_DONE)
+
+    def run(self) -> Iterator[dict]:
+        self._stop.clear()
+        started = time.time()
+        completed = self.report.completed(self.config)
+        pending = []
+        for video_path in self.videos:
+            record = completed.get(video_path)
+            try:
+                unchanged = record is not None and all(record.get(k) == v for k, v in video_fingerprint(video_path).items())
+            except OSError:
+                unchanged = False
+            if not unchanged:
+                pending.append(video_path)
+        skipped = len(self.videos) - len(pending)
+        yield {"event": "start", "videos": len(self.videos), "skipped": skipped}
+
+        counts = {"done": 0, "failed": 0}
+        executor = ThreadPoolExecutor(max_workers=self.max_videos, thread_name_prefix="bulk")
+        futures = []
+        try:
+            futures = [executor.submit(contextvars.copy_context().run, self._work, video_path) for video_path in pending]
+            remaining = len(futures)
+            while remaining:
+                item = self._events.get()
+                if item is _DONE:
+                    remaining -= 1
+                    continue
+                if item["event"] == "video":
+                    counts[item["status"]] += 1
+                yield item
+        finally:
+            self._stop.set()
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=True)
+        yield {
+            "event": "summary",
+            "videos": len(self.videos),
+            **counts,
+            "skipped": skipped,
+            "elapsed": round(time.time() - started, 3),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="Video files or directories to scan")
+    parser.add_argument("--description", action="append", required=True, help="Repeat for several descriptions")
+    parser.add_argument("--report", default="bulk_report.jsonl")
+    parser.add_argument("--method", choices=["detection", "anomaly"], default="detection")
+    parser.add_argument("--every-n-seconds", type=float, default=2.0)
+    parser.add_argument("--max-frames", type=int, default=20, help="Per video")
+    parser.add_argument("--max-videos", type=int, default=2, help="Videos processed at once")
+    parser.add_argument("--prefilter", help='Gate spec, e.g. "motion,person"')
+    parser.add_argument("--keyframes-only", action="store_true", help="Only decode keyframes, for a fast coarse scan")
+    args = parser.parse_args()
+
+    # Imported here: main reads its configuration (API keys, caches) at import time
+    from main import iter_detection_bulk
+
+    videos = find_videos(args.paths)
+    print(f"Scanning {len(videos)} videos for {len(args.description)} descriptions...")
+    try:
+        for event in iter_detection_bulk(
+            videos,
+            args.description,
+            args.report,
+            method=args.method,
+            every_n_seconds=args.every_n_seconds,
+            max_frames=args.max_frames,
+            max_videos=args.max_videos,
+            prefilter=args.prefilter,
+            keyframes_only=args.keyframes_only,
+        ):
+            if event["event"] == "start":
+                print(f"{event['skipped']} videos already in {args.report}")
+            elif event["event"] == "video":
+                if event["status"] == "done":
+                    matches = {prompt: len(timestamps) for prompt, timestamps in event["timestamps"].items()}
+                    print(f"[done] {event['video']} in {event['elapsed']}s: {matches}")
+                else:
+                    print(f"[failed] {event['video']}: {event['error']}")
+            elif event["event"] == "summary":
+                print(json.dumps(event))
+    except KeyboardInterrupt:
+        print(f"Interrupted; rerun the same command to resume from {args.report}")
+
+
+if __name__ == "__main__":
+    main()
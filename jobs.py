@@ -0,0 +1,182 @@
+import json
+import os
+from pathlib import Path
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional, Union
+
+# handler(params, report_progress, is_cancelled) -> JSON-serializable result
+JobHandler = Callable[[dict, Callable[[dict], None], Callable[[], bool]], Any]
+
+class JobManager:
+    """
+    Runs long video jobs on a bounded local thread pool, outside the request thread.
+
+    Job state lives in SQLite so status/result requests can be served by any worker
+    process, and unfinished jobs are picked up again after a restart. Each job gets a
+    directory under `workdir` for its uploaded files, removed once the job finishes.
+    Cancellation is cooperative: queued jobs never start, running jobs are flagged and
+    handlers stop at their next `is_cancelled()` check.
+    """
+
+    def __init__(
+        self,
+        db_path: Union[str, Path] = ".cache/jobs.sqlite3",
+        workdir: Union[str, Path] = ".cache/jobs",
+        max_workers: int = 2,
+    ):
+        self.db_path = str(db_path)
+        self.workdir = Path(workdir)
+        self.workdir.mkdir(parents=True, exist_ok=True)
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.handlers: dict[str, JobHandler] = {}
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._futures: dict[str, Future] = {}
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT NOT NULL, params TEXT NOT NULL, status TEXT NOT NULL, "
+                "progress TEXT, result TEXT, error TEXT, worker_pid INTEGER, "
+                "created REAL NOT NULL, started REAL, finished REAL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30.0)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _update(self, job_id: str, **fields):
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def _status(self, job_id: str) -> Optional[str]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row["status"] if row else None
+
+    def register(self, kind: str, handler: JobHandler):
+        self.handlers[kind] = handler
+
+    def new_job(self) -> tuple[str, Path]:
+        """Reserve a job id and its directory, for saving uploads before `submit`."""
+        job_id = uuid.uuid4().hex
+        job_dir = self.workdir / job_id
+        job_dir.mkdir(parents=True)
+        return job_id, job_dir
+
+    def submit(self, job_id: str, kind: str, params: dict) -> str:
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, params, status, created) VALUES (?, ?, ?, 'queued', ?)",
+                (job_id, kind, json.dumps(params), time.time()),
+            )
+        self._enqueue(job_id)
+        return job_id
+
+    def _enqueue(self, job_id: str):
+        with self._lock:
+            self._futures[job_id] = self.executor.submit(self._run, job_id)
+
+    def _claim(self, job_id: str) -> Optional[sqlite3.Row]:
+        """Atomically move a queued job to running, so no other worker can run it too."""
+        with self._connect() as conn:
+            claimed = conn.execute(
+                "UPDATE jobs SET status = 'running', worker_pid = ?, started = ? WHERE id = ? AND status = 'queued'",
+                (os.getpid(), time.time(), job_id),
+            ).rowcount
+            if not claimed:
+                return None
+            return conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+    def _run(self, job_id: str):
+        row = self._claim(job_id)
+        if row is None:
+            return
+        try:
+            result = self.handlers[row["kind"]](
+                json.loads(row["params"]),
+                lambda progress: self._update(job_id, progress=json.dumps(progress)),
+                lambda: self._status(job_id) == "cancelling",
+            )
+            if self._status(job_id) == "cancelling":
+                self._update(job_id, status="cancelled", finished=time.time())
+            else:
+                self._update(job_id, status="succeeded", result=json.dumps(result), finished=time.time())
+        except Exception as e:
+            self._update(job_id, status="failed", error=str(e), finished=time.time())
+        finally:
+            shutil.rmtree(self.workdir / job_id, ignore_errors=True)
+            with self._lock:
+                self._futures.pop(job_id, None)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "job_id": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "progress": json.loads(row["progress"]) if row["progress"] else None,
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "created": row["created"],
+            "started": row["started"],
+            "finished": row["finished"],
+        }
+
+    def cancel(self, job_id: str) -> Optional[dict]:
+        with self._connect() as conn:
+            # Queued jobs are cancelled outright; running ones are asked to stop
+            conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id),
+            )
+            conn.execute("UPDATE jobs SET status = 'cancelling' WHERE id = ? AND status = 'running'", (job_id,))
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is not None and future.cancel():
+            shutil.rmtree(self.workdir / job_id, ignore_errors=True)
+        return self.get(job_id)
+
+    @staticmethod
+    def _pid_alive(pid: Optional[int]) -> bool:
+        if not pid:
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def recover(self):
+        """
+        Requeue jobs left unfinished by a previous process. Jobs still owned by another
+        live worker process are left alone.
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, status, worker_pid FROM jobs WHERE status IN ('queued', 'running', 'cancelling')"
+            ).fetchall()
+        for row in rows:
+            if row["status"] != "queued" and row["worker_pid"] != os.getpid() and self._pid_alive(row["worker_pid"]):
+                continue
+            if row["status"] == "cancelling":
+                self._update(row["id"], status="cancelled", finished=time.time())
+            elif not (self.workdir / row["id"]).exists():
+                self._update(row["id"], status="failed", error="Job files were lost before a restart", finished=time.time())
+            else:
+                self._update(row["id"], status="queued", worker_pid=None, progress=None)
+                self._enqueue(row["id"])
@@ -1,17 +1,315 @@
 import base64
+import gzip
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+import contextvars
+import hashlib
 import os
 from pathlib import Path
+import random
+import sqlite3
 import tempfile
+import threading
 import time
-from typing import Optional, Union
+from typing import Callable, Iterable, Iterator, Optional, TypeVar, Union
 from PIL import Image
-from groq import Groq
+from groq import APIConnectionError, APIStatusError, Groq
 import re
 import json
 from groq.types.chat import ChatCompletion
 import requests
 
-from more_itertools import chunked
+import metrics
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+_shared_clients: dict[tuple[int, str], Groq] = {}
+_shared_clients_lock = threading.Lock()
+
+def get_shared_client(api_key: str) -> Groq:
+    """
+    Return this process's Groq client for `api_key`, creating it on first use.
+    Groq clients are thread-safe, so sharing one keeps a single keep-alive
+    connection pool per key instead of a new one per frame.
+    """
+    key = (os.getpid(), api_key)
+    with _shared_clients_lock:
+        client = _shared_clients.get(key)
+        if client is None:
+            client = Groq(api_key=api_key)
+            _shared_clients[key] = client
+        return client
+
+class InferenceEngine:
+    """
+    Runs blocking, I/O-bound inference calls concurrently on a thread pool that lives
+    for the whole process. Results are always returned in input order.
+    """
+
+    def __init__(self, max_concurrency: int = 8):
+        self.max_concurrency = max_concurrency
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_concurrency, thread_name_prefix="inference"
+                )
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def map(
+        self,
+        fn: Callable[[T], R],
+        items: Iterable[T],
+        return_exceptions: bool = False,
+    ) -> list[Union[R, Exception]]:
+        """
+        Apply `fn` to every item concurrently.
+
+        Args:
+            fn (callable): Blocking function to run for each item.
+            items (iterable): Inputs, e.g. data URLs in timestamp order.
+            return_exceptions (bool): Put exceptions in the result list in place of the
+                failed items instead of raising the first one.
+
+        Returns:
+            list: Results in the same order as `items`.
+        """
+        executor = self._get_executor()
+        # Each call runs in a copy of the caller's context, so it records into the caller's trace
+        futures = [executor.submit(contextvars.copy_context().run, fn, item) for item in items]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                if not return_exceptions:
+                    for pending in futures:
+                        pending.cancel()
+                    raise
+                results.append(e)
+        return results
+
+    def submit(self, fn: Callable[[T], R], item: T) -> Future:
+        """Schedule one call in a copy of the caller's context; for callers that bound their own in-flight work."""
+        return self._get_executor().submit(contextvars.copy_context().run, fn, item)
+
+    def imap_unordered(self, fn: Callable[[T], R], items: Iterable[T]) -> Iterator[tuple[int, Union[R, Exception]]]:
+        """
+        Apply `fn` to every item concurrently and yield (index, result) as each call
+        finishes. Failed calls yield their exception as the result.
+        """
+        executor = self._get_executor()
+        futures = {executor.submit(contextvars.copy_context().run, fn, item): i for i, item in enumerate(items)}
+        try:
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result()
+                except Exception as e:
+                    yield futures[future], e
+        finally:
+            # The consumer stopped early (e.g. a client disconnected): drop queued calls
+            for future in futures:
+                future.cancel()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+
+def parse_reset_duration(value: str) -> float:
+    """Parse rate-limit reset durations such as "7.66s", "2m59.56s", "1h2m" or "450ms" into seconds."""
+    seconds = 0.0
+    for amount, unit in re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value):
+        seconds += float(amount) * {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}[unit]
+    if seconds == 0.0:
+        try:
+            seconds = float(value)
+        except ValueError:
+            pass
+    return seconds
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. Reservations may drive the level negative, in which case
+    the caller is told how long to wait until its reservation is covered.
+    """
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.level = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.refill_per_second)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        with self._lock:
+            self._refill()
+            return max(0.0, (amount - self.level) / self.refill_per_second)
+
+    def reserve(self, amount: float) -> float:
+        """Take `amount` tokens and return how many seconds to wait before using them."""
+        with self._lock:
+            self._refill()
+            self.level -= amount
+            return max(0.0, -self.level / self.refill_per_second)
+
+    def adjust(self, amount: float):
+        """Give back (positive) or take (negative) tokens after the real cost is known."""
+        with self._lock:
+            self._refill()
+            self.level = min(self.capacity, self.level + amount)
+
+    def sync(self, remaining: float):
+        """Never believe we have more tokens left than the server says we do."""
+        with self._lock:
+            self._refill()
+            self.level = min(self.level, remaining)
+
+class _KeyState:
+    def __init__(self, api_key: str, requests_per_minute: float, tokens_per_minute: float):
+        self.api_key = api_key
+        # SDK retries are disabled so that every attempt goes through the scheduler
+        self.client = get_shared_client(api_key).with_options(max_retries=0)
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60.0)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60.0)
+        self.blocked_until = 0.0
+        self.stats = {"requests": 0, "rate_limited": 0, "retries": 0, "failures": 0}
+
+    def wait_time(self, estimated_tokens: int) -> float:
+        return max(
+            self.blocked_until - time.monotonic(),
+            self.requests.wait_time(1),
+            self.tokens.wait_time(estimated_tokens),
+        )
+
+    def update_from_headers(self, headers):
+        """Sync the buckets with Groq's x-ratelimit-* and retry-after response headers."""
+        now = time.monotonic()
+        for kind, bucket in (("requests", self.requests), ("tokens", self.tokens)):
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            if remaining is None:
+                continue
+            try:
+                bucket.sync(float(remaining))
+            except ValueError:
+                continue
+            reset = headers.get(f"x-ratelimit-reset-{kind}")
+            if float(remaining) <= 0 and reset:
+                self.blocked_until = max(self.blocked_until, now + parse_reset_duration(reset))
+        retry_after = headers.get("retry-after")
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, now + parse_reset_duration(retry_after))
+
+class RateLimitScheduler:
+    """
+    Spreads requests over a pool of API keys while staying under each key's
+    requests-per-minute and tokens-per-minute limits. Retries rate-limited (429),
+    server (5xx) and connection errors with jittered exponential backoff, moving to
+    whichever key frees up first.
+    """
+
+    def __init__(
+        self,
+        api_keys: list[str],
+        requests_per_minute: float = 30,
+        tokens_per_minute: float = 30_000,
+        max_retries: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+    ):
+        if not api_keys:
+            raise ValueError("At least one API key is required")
+        self.keys = [_KeyState(key, requests_per_minute, tokens_per_minute) for key in api_keys]
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+
+    def _acquire(self, estimated_tokens: int) -> _KeyState:
+        with self._lock:
+            state = min(self.keys, key=lambda s: s.wait_time(estimated_tokens))
+            wait = max(
+                state.blocked_until - time.monotonic(),
+                state.requests.reserve(1),
+                state.tokens.reserve(estimated_tokens),
+            )
+        if wait > 0:
+            metrics.record("rate_limit_wait", wait)
+            time.sleep(wait)
+        return state
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return delay * random.uniform(0.5, 1.0)
+
+    def call(self, request: Callable, estimated_tokens: int = 2_000):
+        """
+        Run `request(client)` on the least loaded key and return the parsed response.
+        `request` must return a raw response (``client.chat.completions.with_raw_response.create``)
+        so that rate-limit headers can be read.
+        """
+        attempt = 0
+        while True:
+            state = self._acquire(estimated_tokens)
+            self._count(state, "requests")
+            try:
+                raw = request(state.client)
+            except APIStatusError as e:
+                state.update_from_headers(e.response.headers)
+                if e.status_code == 429:
+                    self._count(state, "rate_limited")
+                    metrics.GROQ_REQUESTS.inc(outcome="rate_limited")
+                else:
+                    metrics.GROQ_REQUESTS.inc(outcome="error")
+                # Other 4xx errors (bad request, auth, payload too large) fail the same way
+                # on every retry, and say nothing about the key's health
+                retryable = e.status_code == 429 or e.status_code >= 500
+                if not retryable or attempt >= self.max_retries:
+                    self._count(state, "failures")
+                    raise
+                if e.status_code >= 500:
+                    # Without an explicit reset from the server, rest this key for a backoff period
+                    with self._lock:
+                        state.blocked_until = max(state.blocked_until, time.monotonic() + self._backoff(attempt))
+                metrics.RETRIES.inc(reason="rate_limited" if e.status_code == 429 else "server_error")
+            except APIConnectionError:
+                metrics.GROQ_REQUESTS.inc(outcome="connection_error")
+                if attempt >= self.max_retries:
+                    self._count(state, "failures")
+                    raise
+                metrics.RETRIES.inc(reason="connection_error")
+            else:
+                state.update_from_headers(raw.headers)
+                response = raw.parse()
+                usage = getattr(response, "usage", None)
+                if usage is not None and usage.total_tokens:
+                    state.tokens.adjust(estimated_tokens - usage.total_tokens)
+                return response
+
+            self._count(state, "retries")
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+
+    def _count(self, state: _KeyState, name: str):
+        # Keys are shared by every inference thread
+        with self._lock:
+            state.stats[name] += 1
+
+    def stats(self) -> dict[str, dict]:
+        """Per-key request, rate-limit, retry and failure counts (keys are masked)."""
+        with self._lock:
+            return {f"...{state.api_key[-4:]}": dict(state.stats) for state in self.keys}
 
 def remove_nonalphanumeric(s: str) -> str:
     return re.sub(r'[^a-zA-Z0-9]', '', s)
@@ -19,6 +317,27 @@ def remove_nonalphanumeric(s: str) -> str:
 def clean_output(output: str):
     return remove_nonalphanumeric(output.strip().lower())
 
+def format_numbered_list(items: list[str]) -> str:
+    return "\n".join(f"{i}. {item.strip()}" for i, item in enumerate(items, start=1))
+
+def parse_multi_answer(output: str, num_answers: int) -> list[str]:
+    """
+    Parse a per-item Yes/No answer such as {"1": "Yes", "2": "No"} (or "1: Yes" lines)
+    into a list of cleaned answers. Items the model skipped come back as "".
+    """
+    answers: dict[str, str] = {}
+    match = re.search(r"\{.*\}", output, re.DOTALL)
+    if match:
+        try:
+            parsed = json.loads(match.group(0))
+            answers = {str(key).strip(): str(value) for key, value in parsed.items()}
+        except (json.JSONDecodeError, AttributeError):
+            answers = {}
+    if not answers:
+        for number, value in re.findall(r"\b(\d+)\s*[.:)\-]\s*\W*(yes|no)\b", output, re.IGNORECASE):
+            answers[number] = value
+    return [clean_output(answers.get(str(i), "")) for i in range(1, num_answers + 1)]
+
 class LlamaPromptTemplates:
     anomaly_detection_prompt_template: str = """You are given an image and a set of rules that define what is considered normal.
 
@@ -38,142 +357,476 @@ Do not include any explanation or additional text.
     Do not include any explanation or additional text.
     """
 
+    multi_anomaly_detection_prompt_template: str = """You are given an image and a numbered list of rules that define what is considered normal.
+
+Rules:
+{input}
+
+For each rule, determine if the image shows any **anomaly** that violates it.
+
+Respond only with a JSON object mapping each rule number to "Yes" or "No", for example {{"1": "No", "2": "Yes"}}.
+Do not include any explanation or additional text.
+"""
+
+    multi_obj_detection_prompt_template: str = """For each numbered object below, determine if it is present in the image:
+{input}
+
+Respond only with a JSON object mapping each object number to "Yes" or "No", for example {{"1": "No", "2": "Yes"}}.
+Do not include any explanation or additional text.
+"""
+
     image_description_prompt_template: str = """Describe the contents of the image in detail.
 Mention any notable objects, actions, people, text, numbers, or scenery.
 Use complete sentences and be specific.
 """
     
-    event_detection_prompt_template: str = """You are given four consecutive video frames. Determine if the following action/event occurred in these frames:
+    event_detection_prompt_template: str = """You are given a grid of consecutive video frames, in order from left to right and top to bottom. Determine if the following action/event occurred in these frames:
     {input}
 
     Respond with a single word: Yes or No.
     Do not include any explanation or additional text.
     """
 
+class InferenceCache:
+    """
+    Disk-backed LRU cache of chat completions, keyed by image content, rendered prompt,
+    model and prompt template. Backed by SQLite in WAL mode so several Flask worker
+    processes (and threads) can share one cache file.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path] = ".cache/inference_cache.sqlite3",
+        max_entries: int = 10_000,
+        ttl_seconds: Optional[float] = None,
+    ):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO counters VALUES ('hits', 0), ('misses', 0)")
+
+    def __getstate__(self):
+        # Connections can't cross process boundaries; each process opens its own
+        state = self.__dict__.copy()
+        del state["_local"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def make_key(image: str, prompt: str, model: str, prompt_template: Optional[str] = None) -> str:
+        image_hash = hashlib.sha256(image.encode("utf-8")).hexdigest()
+        key_parts = json.dumps([image_hash, prompt, model, prompt_template or ""])
+        return hashlib.sha256(key_parts.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute("SELECT value, created FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is not None and self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            row = None
+
+        if row is None:
+            self.misses += 1
+            conn.execute("UPDATE counters SET value = value + 1 WHERE name = 'misses'")
+            return None
+
+        self.hits += 1
+        conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+        conn.execute("UPDATE counters SET value = value + 1 WHERE name = 'hits'")
+        return row[0]
+
+    def set(self, key: str, value: str):
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", (key, value, now, now))
+            # Evict the least recently used entries once over capacity
+            conn.execute(
+                "DELETE FROM entries WHERE key IN ("
+                "SELECT key FROM entries ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def clear(self):
+        self._connect().execute("DELETE FROM entries")
+
+    def stats(self) -> dict:
+        """Hit/miss counts for this process and totals across every process sharing the file."""
+        conn = self._connect()
+        totals = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+        entries = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        total_lookups = totals["hits"] + totals["misses"]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "total_hits": totals["hits"],
+            "total_misses": totals["misses"],
+            "total_hit_rate": totals["hits"] / total_lookups if total_lookups else 0.0,
+            "entries": entries,
+        }
+
+class BatchItemError(Exception):
+    """A request inside a Groq batch that failed or came back without a result."""
+
+    def __init__(self, custom_id: str, message: str, status_code: Optional[int] = None):
+        super().__init__(f"{custom_id}: {message}")
+        self.custom_id = custom_id
+        self.status_code = status_code
+
 class GroqBatchManager:
-    def __init__(self, api_key: str, model: str):
+    """
+    Runs chat completions through Groq's batch API.
+
+    Every request carries a `custom_id` and results are matched back by id, never by
+    line order. Requests are streamed into JSONL shards that stay within the API's
+    file limits, up to `max_in_flight` shards run as separate batches at once, and
+    all uploads and polls go through one HTTP session. Requests listed in a batch's
+    error file come back as `BatchItemError`s instead of failing the whole run.
+
+    `base_url` defaults to GROQ_BASE_URL, like the Groq SDK, so the manager can be
+    pointed at a local stand-in server.
+    """
+
+    max_lines_per_file: int = 50_000
+    max_file_bytes: int = 200 * 1024 * 1024
+    terminal_statuses = {"completed", "failed", "expired", "cancelled"}
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str,
+        base_url: Optional[str] = None,
+        max_items_per_batch: Optional[int] = None,
+        max_in_flight: int = 4,
+        compress: bool = False,
+        poll_interval: float = 2.0,
+        max_poll_interval: float = 60.0,
+        completion_window: str = "24h",
+        timeout: float = 60.0,
+        session: Optional[requests.Session] = None,
+    ):
         self.api_key = api_key
         self.model = model
+        base_url = base_url or os.environ.get("GROQ_BASE_URL") or "https://api.groq.com"
+        self.api_url = base_url.rstrip("/") + "/openai/v1"
+        self.max_items_per_batch = min(max_items_per_batch or self.max_lines_per_file, self.max_lines_per_file)
+        self.max_in_flight = max_in_flight
+        self.compress = compress
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.completion_window = completion_window
+        self.timeout = timeout
+        self.session = session if session is not None else requests.Session()
         self.headers = {
             "Authorization": f"Bearer {self.api_key}"
         }
 
-    def prepare_jsonl(self, items: list[tuple[str, str]]) -> str:
-        fd, path = tempfile.mkstemp(suffix=".jsonl", prefix="groq_batch_", text=True)
-        with os.fdopen(fd, "w") as f:
-            for prompt, image_url in items:
-                line = {
-                    "messages": [
-                        {
-                            "role": "user",
-                            "content": [
-                                {"type": "text", "text": prompt},
-                                {"type": "image_url", "image_url": {"url": image_url}}
-                            ]
-                        }
-                    ]
-                }
-                f.write(json.dumps(line) + "\n")
-        return path
+    def make_request(self, custom_id: str, prompt: str, image_url: str) -> dict:
+        return {
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": self.model,
+                "messages": [
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "text", "text": prompt},
+                            {"type": "image_url", "image_url": {"url": image_url}}
+                        ]
+                    }
+                ]
+            },
+        }
+
+    def prepare_jsonl(self, items: Iterable[tuple[str, str, str]]) -> Iterator[tuple[str, list[str]]]:
+        """
+        Stream (custom_id, prompt, image_url) requests into JSONL shard files (gzipped if
+        `compress`), starting a new shard before one would exceed the line or size limit.
+
+        Yields:
+            tuple: (path of the finished shard, custom_ids written to it).
+        """
+        f, path, ids, size = None, None, [], 0
+        try:
+            for custom_id, prompt, image_url in items:
+                line = (json.dumps(self.make_request(custom_id, prompt, image_url)) + "\n").encode("utf-8")
+                if len(line) > self.max_file_bytes:
+                    raise ValueError(f"Request {custom_id} alone exceeds the batch file limit of {self.max_file_bytes} bytes")
+                if f is not None and (len(ids) >= self.max_items_per_batch or size + len(line) > self.max_file_bytes):
+                    f.close()
+                    f = None
+                    yield path, ids
+                if f is None:
+                    fd, path = tempfile.mkstemp(suffix=".jsonl.gz" if self.compress else ".jsonl", prefix="groq_batch_")
+                    if self.compress:
+                        os.close(fd)
+                        f = gzip.open(path, "wb")
+                    else:
+                        f = os.fdopen(fd, "wb")
+                    ids, size = [], 0
+                f.write(line)
+                ids.append(custom_id)
+                size += len(line)
+            if f is not None:
+                f.close()
+                f = None
+                yield path, ids
+        finally:
+            # Only reached with an open shard if writing failed or the consumer stopped early
+            if f is not None:
+                f.close()
+                os.unlink(path)
 
     def upload_batch_file(self, file_path: str) -> str:
-        url = "https://api.groq.com/openai/v1/files"
-        files = {"file": ("batch_file.jsonl", open(file_path, "rb"))}
-        data = {"purpose": "batch"}
-        response = requests.post(url, headers=self.headers, files=files, data=data)
+        filename = "batch_file.jsonl.gz" if self.compress else "batch_file.jsonl"
+        with open(file_path, "rb") as f:
+            response = self.session.post(
+                f"{self.api_url}/files",
+                headers=self.headers,
+                files={"file": (filename, f)},
+                data={"purpose": "batch"},
+                timeout=self.timeout,
+            )
         response.raise_for_status()
         return response.json()["id"]
 
     def submit_batch_job(self, file_id: str) -> str:
-        url = "https://api.groq.com/openai/v1/batches"
         body = {
             "input_file_id": file_id,
             "endpoint": "/v1/chat/completions",
-            "completion_window": "24h",
+            "completion_window": self.completion_window,
             "metadata": {"source": "llama-model-batch"},
-            "model": self.model
         }
-        response = requests.post(url, headers=self.headers, json=body)
+        response = self.session.post(f"{self.api_url}/batches", headers=self.headers, json=body, timeout=self.timeout)
         response.raise_for_status()
         return response.json()["id"]
 
-    def wait_for_completion(self, batch_id: str, poll_interval: float = 2.0):
-        url = f"https://api.groq.com/openai/v1/batches/{batch_id}"
-        while True:
-            response = requests.get(url, headers=self.headers)
-            response.raise_for_status()
-            status = response.json()
-            if status["status"] in {"completed", "failed", "cancelled"}:
-                return status
-            print(f"  ...batch {batch_id} status: {status['status']}, sleeping {poll_interval}s")
-            time.sleep(poll_interval)
-
-    def fetch_results(self, output_file_id: str) -> list[ChatCompletion]:
-        url = f"https://api.groq.com/openai/v1/files/{output_file_id}/content"
-        response = requests.get(url, headers=self.headers)
+    def get_batch(self, batch_id: str) -> dict:
+        response = self.session.get(f"{self.api_url}/batches/{batch_id}", headers=self.headers, timeout=self.timeout)
         response.raise_for_status()
-        return [json.loads(line) for line in response.text.strip().splitlines()]
+        return response.json()
+
+    def fetch_results(self, file_id: str) -> Iterator[dict]:
+        """Stream the JSON lines of a batch output or error file."""
+        with self.session.get(
+            f"{self.api_url}/files/{file_id}/content", headers=self.headers, timeout=self.timeout, stream=True
+        ) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line.strip():
+                    yield json.loads(line)
+
+    @staticmethod
+    def parse_result(line: dict) -> Union[ChatCompletion, BatchItemError]:
+        custom_id = line.get("custom_id", "")
+        response = line.get("response") or {}
+        body = response.get("body") or {}
+        status_code = response.get("status_code")
+        if not line.get("error") and status_code == 200:
+            return ChatCompletion.model_validate(body)
+        error = line.get("error") or body.get("error") or {}
+        message = error.get("message") if isinstance(error, dict) else str(error)
+        return BatchItemError(custom_id, message or f"request failed with status {status_code}", status_code)
+
+    def collect_results(self, status: dict, custom_ids: list[str]) -> dict[str, Union[ChatCompletion, BatchItemError]]:
+        """Read a finished batch's output and error files into results keyed by custom_id."""
+        results: dict[str, Union[ChatCompletion, BatchItemError]] = {}
+        for file_key in ("output_file_id", "error_file_id"):
+            if status.get(file_key):
+                for line in self.fetch_results(status[file_key]):
+                    results[line.get("custom_id", "")] = self.parse_result(line)
+        for custom_id in custom_ids:
+            if custom_id not in results:
+                results[custom_id] = BatchItemError(custom_id, f"no result, batch {status['id']} {status['status']}")
+        return results
+
+    def run(self, items: Iterable[tuple[str, str, str]]) -> dict[str, Union[ChatCompletion, BatchItemError]]:
+        """
+        Run (custom_id, prompt, image_url) requests as one or more batches.
+
+        Shards are uploaded and submitted as they are written, keeping at most
+        `max_in_flight` batches pending. Each pending batch is polled with
+        exponential backoff, from `poll_interval` up to `max_poll_interval`.
+
+        Returns:
+            dict: custom_id -> ChatCompletion, or BatchItemError for failed requests.
+        """
+        shards = self.prepare_jsonl(items)
+        # batch_id -> (custom_ids, next poll time, current poll interval)
+        in_flight: dict[str, tuple[list[str], float, float]] = {}
+        results: dict[str, Union[ChatCompletion, BatchItemError]] = {}
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(in_flight) < self.max_in_flight:
+                    shard = next(shards, None)
+                    if shard is None:
+                        exhausted = True
+                        break
+                    path, custom_ids = shard
+                    try:
+                        file_id = self.upload_batch_file(path)
+                    finally:
+                        os.unlink(path)
+                    batch_id = self.submit_batch_job(file_id)
+                    print(f"  ...submitted batch {batch_id} with {len(custom_ids)} requests")
+                    in_flight[batch_id] = (custom_ids, time.monotonic() + self.poll_interval, self.poll_interval)
+
+                if not in_flight:
+                    return results
+
+                batch_id = min(in_flight, key=lambda b: in_flight[b][1])
+                custom_ids, next_poll, interval = in_flight[batch_id]
+                time.sleep(max(0.0, next_poll - time.monotonic()))
+                status = self.get_batch(batch_id)
+                if status["status"] in self.terminal_statuses:
+                    del in_flight[batch_id]
+                    results.update(self.collect_results(status, custom_ids))
+                    print(f"  ...batch {batch_id} {status['status']}")
+                else:
+                    interval = min(interval * 2, self.max_poll_interval)
+                    in_flight[batch_id] = (custom_ids, time.monotonic() + interval, interval)
+                    print(f"  ...batch {batch_id} status: {status['status']}, next poll in {interval:.0f}s")
+        finally:
+            shards.close()
 
 class LlamaModel:
-    def __init__(self, api_key: str, model: str = "meta-llama/llama-4-scout-17b-16e-instruct"):
+    def __init__(
+        self, 
+        api_key: str, 
+        model: str = "meta-llama/llama-4-scout-17b-16e-instruct",
+        cache: Optional[InferenceCache] = None,
+        scheduler: Optional[RateLimitScheduler] = None,
+    ):
         LLAMA_MODELS: list[str] = ["meta-llama/llama-4-scout-17b-16e-instruct", "meta-llama/llama-4-maverick-17b-128e-instruct"]
         assert model in LLAMA_MODELS, f"{repr(model)} not in {LLAMA_MODELS}"
 
-        self.client = Groq(api_key=api_key)
+        self.client = get_shared_client(api_key)
         self.model = model
+        self.cache = cache
+        self.scheduler = scheduler
+        self.prompt_template: Optional[str] = None
     
-    def generate(self, prompt: str, image: str):
-        response = self.client.chat.completions.create(
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": image
-                            },
+    def generate(self, prompt: str, image: str) -> ChatCompletion:
+        cache_key = None
+        if self.cache is not None:
+            cache_key = InferenceCache.make_key(image, prompt, self.model, self.prompt_template)
+            cached = self.cache.get(cache_key)
+            metrics.CACHE_LOOKUPS.inc(result="hit" if cached is not None else "miss")
+            if cached is not None:
+                return ChatCompletion.model_validate_json(cached)
+
+        messages = [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt},
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": image
                         },
-                    ],
-                }
-            ],
-            model=self.model,
-        )
+                    },
+                ],
+            }
+        ]
+        if self.scheduler is not None:
+            # Time only the HTTP call that succeeded, not rate-limit waits or failed attempts
+            round_trips = []
+            def create(client: Groq):
+                start = time.perf_counter()
+                raw = client.chat.completions.with_raw_response.create(messages=messages, model=self.model)
+                round_trips.append(time.perf_counter() - start)
+                return raw
+            response = self.scheduler.call(create)
+            metrics.record_completion(response, round_trips[-1])
+        else:
+            start = time.perf_counter()
+            response = self.client.chat.completions.create(messages=messages, model=self.model)
+            metrics.record_completion(response, time.perf_counter() - start)
+        if cache_key is not None:
+            self.cache.set(cache_key, response.model_dump_json())
         return response
     
-    def batch_generate(self, items: list[tuple[str, str]]) -> list[ChatCompletion]:
-        manager = GroqBatchManager(api_key=self.client.api_key, model=self.model)
-
-        print("[1] Creating .jsonl batch file...")
-        file_path = manager.prepare_jsonl(items)
-
-        print("[2] Uploading batch file...")
-        file_id = manager.upload_batch_file(file_path)
-
-        print("[3] Submitting batch job...")
-        batch_id = manager.submit_batch_job(file_id)
+    def batch_generate(
+        self,
+        items: Iterable[tuple[str, str]],
+        max_items_per_batch: Optional[int] = None,
+        max_in_flight: int = 4,
+    ) -> list[Union[ChatCompletion, BatchItemError]]:
+        """
+        Run (prompt, image) pairs through the batch API. `items` may be a generator; it
+        is consumed as the batch files are written, so images needn't all be in memory.
+
+        Returns:
+            list: One ChatCompletion per item in input order, or a BatchItemError for items that failed.
+        """
+        manager = GroqBatchManager(
+            api_key=self.client.api_key,
+            model=self.model,
+            base_url=str(self.client.base_url),
+            max_items_per_batch=max_items_per_batch,
+            max_in_flight=max_in_flight,
+        )
+        custom_ids = []
 
-        print("[4] Waiting for completion...")
-        status = manager.wait_for_completion(batch_id)
-        if status["status"] != "completed":
-            raise RuntimeError(f"Batch job failed with status: {status['status']}")
+        def numbered():
+            for i, (prompt, image) in enumerate(items):
+                custom_ids.append(f"item-{i}")
+                yield custom_ids[-1], prompt, image
 
-        print("[5] Downloading results...")
-        return manager.fetch_results(status["output_file_id"])
+        print("[~] Running requests through the batch API...")
+        results = manager.run(numbered())
+        return [results[custom_id] for custom_id in custom_ids]
 
 class LlamaAnomalyDetection(LlamaModel):
     default_prompt_template: str = LlamaPromptTemplates.anomaly_detection_prompt_template
+    default_multi_prompt_template: str = LlamaPromptTemplates.multi_anomaly_detection_prompt_template
 
     def __init__(
         self, 
         api_key: str, 
         model: str = "meta-llama/llama-4-scout-17b-16e-instruct", 
-        prompt_template: Optional[str] = None
+        prompt_template: Optional[str] = None,
+        cache: Optional[InferenceCache] = None,
+        scheduler: Optional[RateLimitScheduler] = None,
     ):
-        super().__init__(api_key, model)
+        super().__init__(api_key, model, cache, scheduler)
 
         self.prompt_template = prompt_template if prompt_template else LlamaAnomalyDetection.default_prompt_template
+        self.multi_prompt_template = LlamaAnomalyDetection.default_multi_prompt_template
     
     def inference(self, image: str, rules: str) -> str:
         """Send image to Groq's LLaMA model and return a description of what's in the image."""
@@ -181,14 +834,30 @@ class LlamaAnomalyDetection(LlamaModel):
 
         response = self.generate(prompt, image)
         content = response.choices[0].message.content
-        return clean_output(content) if content else ""
+        with metrics.stage("parse"):
+            return clean_output(content) if content else ""
+
+    def multi_inference(self, image: str, rules_list: list[str]) -> list[str]:
+        """Check one image against several rule sets in a single request; one yes/no per rule set."""
+        prompt = self.multi_prompt_template.format(input=format_numbered_list(rules_list))
+        response = self.generate(prompt, image)
+        content = response.choices[0].message.content
+        with metrics.stage("parse"):
+            return parse_multi_answer(content, len(rules_list)) if content else [""] * len(rules_list)
     
-    def batched_inference(self, images: list[str], rules: str):
+    def batched_inference(
+        self, images: Iterable[str], rules: str, max_items_per_batch: Optional[int] = None
+    ) -> list[Union[str, BatchItemError]]:
         prompt = self.prompt_template.format(input=rules) if rules else self.prompt_template
-        batch = [(image, prompt) for image in images]
-        output = self.batch_generate(batch)
-        content = [response.choices[0].message.content for response in output]
-        content = [clean_output(cont) if cont else "" for cont in content]
+        output = self.batch_generate(((prompt, image) for image in images), max_items_per_batch=max_items_per_batch)
+        content = []
+        for response in output:
+            if isinstance(response, BatchItemError):
+                content.append(response)
+            else:
+                cont = response.choices[0].message.content
+                with metrics.stage("parse"):
+                    content.append(clean_output(cont) if cont else "")
         return content
 
 class LlamaImageExplainer(LlamaModel):
@@ -198,9 +867,11 @@ class LlamaImageExplainer(LlamaModel):
         self, 
         api_key: str, 
         model: str = "meta-llama/llama-4-scout-17b-16e-instruct", 
-        prompt_template: Optional[str] = None
+        prompt_template: Optional[str] = None,
+        cache: Optional[InferenceCache] = None,
+        scheduler: Optional[RateLimitScheduler] = None,
     ):
-        super().__init__(api_key, model)
+        super().__init__(api_key, model, cache, scheduler)
 
         self.prompt_template = prompt_template if prompt_template else LlamaImageExplainer.default_prompt_template
     
@@ -212,15 +883,19 @@ class LlamaImageExplainer(LlamaModel):
 
 class LlamaImageDetector(LlamaModel):
     default_prompt_template: str = LlamaPromptTemplates.obj_detection_prompt_template
+    default_multi_prompt_template: str = LlamaPromptTemplates.multi_obj_detection_prompt_template
     
     def __init__(
         self, 
         api_key: str, 
         model: str = "meta-llama/llama-4-scout-17b-16e-instruct", 
-        prompt_template: Optional[str] = None
+        prompt_template: Optional[str] = None,
+        cache: Optional[InferenceCache] = None,
+        scheduler: Optional[RateLimitScheduler] = None,
     ):
-        super().__init__(api_key, model)
+        super().__init__(api_key, model, cache, scheduler)
         self.prompt_template = prompt_template if prompt_template else LlamaImageDetector.default_prompt_template
+        self.multi_prompt_template = LlamaImageDetector.default_multi_prompt_template
 
     @staticmethod
     def image_to_base64(image: Union[str, Path, bytes]) -> str:
@@ -239,13 +914,32 @@ class LlamaImageDetector(LlamaModel):
         prompt = self.prompt_template.format(input=prompt_parameter) if prompt_parameter else self.prompt_template
         response = self.generate(prompt, image)
         content = response.choices[0].message.content
-        return clean_output(content) if content else ""
+        with metrics.stage("parse"):
+            return clean_output(content) if content else ""
+
+    def multi_inference(self, image: str, prompt_parameters: list[str]) -> list[str]:
+        """Check one image for several object descriptions in a single request; one yes/no per description."""
+        prompt = self.multi_prompt_template.format(input=format_numbered_list(prompt_parameters))
+        response = self.generate(prompt, image)
+        content = response.choices[0].message.content
+        with metrics.stage("parse"):
+            return parse_multi_answer(content, len(prompt_parameters)) if content else [""] * len(prompt_parameters)
     
-    def batched_inference(self, images: list[str], prompt_parameter: str) -> list[str]:
-        """Send image + object description to Groq's LLaMA model and return response text."""
+    def batched_inference(
+        self, images: Iterable[str], prompt_parameter: str, max_items_per_batch: Optional[int] = None
+    ) -> list[Union[str, BatchItemError]]:
+        """
+        Send images + object description through the batch API and return response text
+        per image, or a BatchItemError for images whose request failed.
+        """
         prompt = self.prompt_template.format(input=prompt_parameter) if prompt_parameter else self.prompt_template
-        batch = [(image, prompt) for image in images]
-        output = self.batch_generate(batch)
-        content = [response.choices[0].message.content for response in output]
-        content = [clean_output(cont) if cont else "" for cont in content]
+        output = self.batch_generate(((prompt, image) for image in images), max_items_per_batch=max_items_per_batch)
+        content = []
+        for response in output:
+            if isinstance(response, BatchItemError):
+                content.append(response)
+            else:
+                cont = response.choices[0].message.content
+                with metrics.stage("parse"):
+                    content.append(clean_output(cont) if cont else "")
         return content
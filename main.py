@@ -1,34 +1,145 @@
-from audioop import mul
-from functools import partial, reduce
-from itertools import repeat
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
 import os
 import time
-from typing import Literal, Optional
-from cv2.gapi.streaming import timestamp
+from typing import Callable, Iterator, Literal, Optional
 from dotenv import load_dotenv
 from more_itertools import chunked
-from videoparser import VideoFrameSampler
-from llm import LlamaAnomalyDetection, LlamaImageExplainer, LlamaImageDetector, LlamaPromptTemplates
-from groq import APIStatusError, Groq
-import os
-import sys
-from moviepy import VideoFileClip
-import multiprocessing as mp
+from audio import AudioTranscriber, NoAudioTrackError
+import metrics
+from bulk import BulkReport, BulkRunner
+from monitor import Monitor
+from pipeline import DetectionPipeline
+from prefilter import build_cascade
+from store import FrameCache, VideoStore
+from videoparser import FrameEncoder, LiveFrameSampler, ParallelVideoFrameSampler, PyAVVideoFrameSampler, VideoFrameSampler, grid_shape_for
+from llm import (
+    InferenceCache,
+    InferenceEngine,
+    LlamaAnomalyDetection,
+    LlamaImageExplainer,
+    LlamaImageDetector,
+    LlamaPromptTemplates,
+    RateLimitScheduler,
+    get_shared_client,
+)
 
 
 load_dotenv()
 GROQ_API_KEY = os.environ["GROQ_API_KEY"]
+# Optional comma-separated pool of keys to spread load across
+GROQ_API_KEYS = [key.strip() for key in os.environ.get("GROQ_API_KEYS", GROQ_API_KEY).split(",") if key.strip()]
+SCHEDULER = RateLimitScheduler(
+    GROQ_API_KEYS,
+    requests_per_minute=float(os.environ.get("GROQ_REQUESTS_PER_MINUTE", 30)),
+    tokens_per_minute=float(os.environ.get("GROQ_TOKENS_PER_MINUTE", 30_000)),
+)
+INFERENCE_CACHE = InferenceCache(
+    os.environ.get("LLAMAVID_CACHE_PATH", ".cache/inference_cache.sqlite3"),
+    max_entries=int(os.environ.get("LLAMAVID_CACHE_MAX_ENTRIES", 10_000)),
+    ttl_seconds=float(os.environ["LLAMAVID_CACHE_TTL"]) if os.environ.get("LLAMAVID_CACHE_TTL") else None,
+)
+# Upload size dominates request latency, so frames are downscaled and compressed before sending
+FRAME_ENCODER = FrameEncoder(
+    max_side=int(os.environ.get("LLAMAVID_MAX_SIDE", 1280)),
+    codec=os.environ.get("LLAMAVID_CODEC", "jpeg"),
+    quality=int(os.environ.get("LLAMAVID_QUALITY", 80)),
+    max_bytes=int(os.environ["LLAMAVID_MAX_BYTES"]) if os.environ.get("LLAMAVID_MAX_BYTES") else None,
+)
+VIDEO_STORE = VideoStore(
+    os.environ.get("LLAMAVID_VIDEO_STORE", ".cache/videos"),
+    max_bytes=int(os.environ["LLAMAVID_VIDEO_STORE_MAX_BYTES"]) if os.environ.get("LLAMAVID_VIDEO_STORE_MAX_BYTES") else None,
+)
+FRAME_CACHE = FrameCache(
+    os.environ.get("LLAMAVID_FRAME_CACHE", ".cache/frames"),
+    max_bytes=int(os.environ.get("LLAMAVID_FRAME_CACHE_MAX_BYTES", 1 << 30)),
+)
+# Decoder processes per video; above 1, long uploads are decoded in parallel segments
+DECODE_WORKERS = int(os.environ.get("LLAMAVID_DECODE_WORKERS", 1))
+# Shared memory the parallel decoders may fill at once; keep it under the container's /dev/shm
+DECODE_SHM_BYTES = int(os.environ.get("LLAMAVID_DECODE_SHM_BYTES", 48 << 20))
+# "pyav" decodes with PyAV, scaling frames to the encoder's size inside the decoder
+DECODER = os.environ.get("LLAMAVID_DECODER", "cv2")
+INFERENCE_ENGINE = InferenceEngine(max_concurrency=int(os.environ.get("LLAMAVID_INFERENCE_CONCURRENCY", 8)))
+
+
+def format_span(tile_timestamps: list[float]) -> str:
+    """"3.0" for a single frame, "3.0-6.0" for a grid spanning several frames."""
+    if tile_timestamps[0] == tile_timestamps[-1]:
+        return f"{tile_timestamps[0]}"
+    return f"{tile_timestamps[0]}-{tile_timestamps[-1]}"
+
+def make_sampler(video_path: str, keyframes_only: bool = False) -> VideoFrameSampler:
+    """
+    Sampler that shares the process-wide encoder and decoded-frame cache. `keyframes_only`
+    needs the PyAV decoder and uses it whatever LLAMAVID_DECODER says.
+    """
+    if DECODER == "pyav" or keyframes_only:
+        return PyAVVideoFrameSampler(
+            video_path,
+            max_side=FRAME_ENCODER.max_side,
+            keyframes_only=keyframes_only,
+            encoder=FRAME_ENCODER,
+            frame_cache=FRAME_CACHE,
+            video_hash=VIDEO_STORE.hash_of(video_path),
+        )
+    if DECODE_WORKERS > 1:
+        return ParallelVideoFrameSampler(
+            video_path,
+            workers=DECODE_WORKERS,
+            max_side=FRAME_ENCODER.max_side,
+            max_shm_bytes=DECODE_SHM_BYTES,
+            encoder=FRAME_ENCODER,
+            frame_cache=FRAME_CACHE,
+            video_hash=VIDEO_STORE.hash_of(video_path),
+        )
+    return VideoFrameSampler(
+        video_path,
+        encoder=FRAME_ENCODER,
+        frame_cache=FRAME_CACHE,
+        video_hash=VIDEO_STORE.hash_of(video_path),
+    )
+
+def make_detector(
+    method: Literal["detection", "anomaly"], model: str, use_cache: bool = True
+) -> LlamaImageDetector | LlamaAnomalyDetection:
+    # Live frames never repeat, so caching them would only fill the cache
+    cache = INFERENCE_CACHE if use_cache else None
+    if method == "detection":
+        return LlamaImageDetector(GROQ_API_KEY, model=model, cache=cache, scheduler=SCHEDULER)
+    elif method == "anomaly":
+        return LlamaAnomalyDetection(GROQ_API_KEY, model=model, cache=cache, scheduler=SCHEDULER)
+    raise ValueError("method must be 'detection' or 'anomaly'")
 
+def make_event_detector(model: str) -> LlamaImageDetector:
+    return LlamaImageDetector(
+        GROQ_API_KEY, 
+        model=model, 
+        prompt_template=LlamaPromptTemplates.event_detection_prompt_template,
+        cache=INFERENCE_CACHE,
+        scheduler=SCHEDULER,
+    )
 
-def llm_inference_single(frame_base64, api_key, prompt_input, model, method):
-    cls = LlamaImageDetector if method == "detection" else LlamaAnomalyDetection
-    try:
-        reply = cls(api_key, model=model).inference(frame_base64, prompt_input)
-    except APIStatusError as e:
-        raise Exception(str(e))
-    return reply
+def report_frame(event: dict, subject: str = "Object") -> bool:
+    """Print a pipeline frame event's verdict; True when it's a match."""
+    span = format_span([event["timestamp"], event["end"]])
+    if event.get("filtered"):
+        print(f"[-] Filtered out at {span} sec")
+        return False
+    if "error" in event:
+        print(f"[!] Error at {span} sec: {event['error']}")
+        return False
+    reply = event["reply"]
+    if reply.lower() == "yes":
+        print(f"[✓] {subject} detected at {span} sec")
+        return True
+    elif reply == "no":
+        print(f"[ ] No {subject} at {span} sec")
+    else:
+        print(f"RESPONSE ({span} sec): {reply}")
+    return False
 
-def detection_in_video(
+def iter_detection_in_video(
     video_path: str,
     prompt_input: str,
     method: Literal["detection", "anomaly"] = "detection",
@@ -36,62 +147,174 @@ def detection_in_video(
     max_frames: int = 20,
     model: str = "meta-llama/llama-4-scout-17b-16e-instruct",
     multiframe: bool = False,
-):
-    sampler = VideoFrameSampler(video_path)
-
-    frames_base64 = sampler.sample_frames(
+    sampling: Literal["fixed", "adaptive"] = "fixed",
+    scene_threshold: float = 0.05,
+    max_gap_seconds: float = 10.0,
+    dedup_threshold: Optional[int] = 5,
+    grid_shape: tuple[int, int] = (2, 2),
+    prefilter: Optional[str] = None,
+    keyframes_only: bool = False,
+) -> Iterator[dict]:
+    """
+    Run detection and yield events as soon as each inference completes. Frames are
+    decoded, encoded and sent as the video is read, so memory stays flat however long
+    the video is:
+
+    - {"event": "start", "frames"} first, with the planned number of images
+    - {"event": "frame", "timestamp", "end", "reply", "matched"} per frame, in completion
+      order (with "error" instead of "reply" if its request failed)
+    - {"event": "progress", "done", "total"} as frames complete
+    - {"event": "summary", "timestamps", ...} last, with all matches in timestamp order
+
+    `prefilter` is a gate spec for `prefilter.build_cascade`, e.g. "motion,person".
+    Frames it rejects are reported straight away as non-matches with "filtered": True,
+    without an API call, and frames without motion repeat the last forwarded frame's
+    verdict with "repeated": True. `keyframes_only` samples the first keyframe at or after each
+    sampling time and skips decoding everything else, for fast coarse scans.
+    """
+    temp = time.time()
+    cascade = build_cascade(prefilter) if prefilter else None
+    llm = make_detector(method, model)
+    pipeline = DetectionPipeline(
+        make_sampler(video_path, keyframes_only),
+        lambda images: [llm.inference(image, prompt_input) for image in images],
+        INFERENCE_ENGINE,
         every_n_seconds=every_n_seconds,
-        output_format="base64",
         max_frames=max_frames,
-        multiframe=multiframe,
+        # Single frames are 1x1 grids, so both modes share one exact per-tile timestamp map
+        grid_shape=grid_shape if multiframe else (1, 1),
+        sampling=sampling,
+        scene_threshold=scene_threshold,
+        max_gap_seconds=max_gap_seconds,
+        dedup_threshold=dedup_threshold,
+        cascade=cascade,
     )
 
-    assert method in ["detection", "anomaly"]
-
-    # if method == "detection":
-    #     llm = LlamaImageDetector(GROQ_API_KEY, model=model)
-    # elif method == "anomaly":
-    #     llm = LlamaAnomalyDetection(GROQ_API_KEY, model=model)
-    # else:
-    #     raise ValueError("method must be 'detection' or 'anomaly'")
     # explainer = LLamaImageExplainer(GROQ_API_KEY, model=model)
 
     matched_timestamps = []
-    timestamps = [round(i * every_n_seconds * 4 if multiframe else i * every_n_seconds, 5) for i in range(len(frames_base64))]
-    
-    replies = []
-    temp = time.time()
     print("Querying Groq API...")        
-    with mp.Pool(4) as pool:
-        try:
-            replies = pool.map(
-                partial(llm_inference_single, api_key=GROQ_API_KEY, prompt_input=prompt_input, model=model, method=method),
-                [f"data:image/jpeg;base64,{frame}" for frame in frames_base64]
-            )
-        except Exception as e:
-            print(f"[!] Error: {e}")
-    print(f"{time.time()-temp:.2f}s")
-
-    for reply, timestamp_sec in zip(replies, timestamps):
-        if reply.lower() == "yes":
-            matched_timestamps.append(timestamp_sec)
-            if multiframe:
-                print(f"[✓] Object detected at {timestamp_sec}-{timestamp_sec+every_n_seconds*4} sec")
-            else:
-                print(f"[✓] Object detected at {timestamp_sec} sec")
-        elif reply == "no":
-            if multiframe:
-                print(f"[ ] No object at {timestamp_sec}-{timestamp_sec+every_n_seconds*4} sec")
-            else:
-                print(f"[ ] No object at {timestamp_sec} sec")
-
-            # explanation = explainer.explain(image)
-            # print(f"EXPLANATION: {explanation}")
-        else:
-            print(f"RESPONSE ({timestamp_sec} sec): {reply}")
+    for event in pipeline.run():
+        if event["event"] == "frame":
+            event["matched"] = report_frame(event)
+            if event["matched"]:
+                matched_timestamps.append(event["timestamp"])
+        elif event["event"] == "summary":
+            trace = metrics.current_trace()
+            print(f"{time.time()-temp:.2f}s")
+            print(f"Sent {event['requests']} requests for {event['frames']} frames")
+            if trace is not None:
+                print(f"Stages: {trace.summary()['stages']}")
+            print(f"Inference cache: {INFERENCE_CACHE.stats()}")
+            print(f"Scheduler: {SCHEDULER.stats()}")
+            if cascade is not None:
+                print(f"Pre-filter: {cascade.stats()}")
+            event["timestamps"] = sorted(matched_timestamps)
+            if trace is not None:
+                event["trace"] = trace.summary()
+        yield event
 
+def detection_in_video(
+    video_path: str,
+    prompt_input: str,
+    method: Literal["detection", "anomaly"] = "detection",
+    every_n_seconds: float = 2.0,
+    max_frames: int = 20,
+    model: str = "meta-llama/llama-4-scout-17b-16e-instruct",
+    multiframe: bool = False,
+    sampling: Literal["fixed", "adaptive"] = "fixed",
+    scene_threshold: float = 0.05,
+    max_gap_seconds: float = 10.0,
+    dedup_threshold: Optional[int] = 5,
+    grid_shape: tuple[int, int] = (2, 2),
+    prefilter: Optional[str] = None,
+    keyframes_only: bool = False,
+):
+    matched_timestamps = []
+    for event in iter_detection_in_video(
+        video_path, prompt_input, method, every_n_seconds, max_frames, model, multiframe,
+        sampling, scene_threshold, max_gap_seconds, dedup_threshold, grid_shape, prefilter, keyframes_only,
+    ):
+        if event["event"] == "summary":
+            matched_timestamps = event["timestamps"]
     return matched_timestamps
 
+def make_multi_infer(
+    llm: LlamaImageDetector | LlamaAnomalyDetection, query_groups: list[list[str]]
+) -> Callable[[list[str]], list[list]]:
+    """Pipeline `infer_batch` asking every group of descriptions about one image, one request per group."""
+    def infer(images: list[str]) -> list[list]:
+        # One reply per image: its answer to every description, or the error of a failed group
+        answers = []
+        for group in query_groups:
+            try:
+                answers.extend(llm.multi_inference(images[0], group))
+            except Exception as e:
+                answers.extend([e] * len(group))
+        return [answers]
+
+    return infer
+
+def detection_in_video_multi(
+    video_path: str,
+    prompt_inputs: list[str],
+    method: Literal["detection", "anomaly"] = "detection",
+    every_n_seconds: float = 2.0,
+    max_frames: int = 20,
+    model: str = "meta-llama/llama-4-scout-17b-16e-instruct",
+    multiframe: bool = False,
+    sampling: Literal["fixed", "adaptive"] = "fixed",
+    scene_threshold: float = 0.05,
+    max_gap_seconds: float = 10.0,
+    dedup_threshold: Optional[int] = 5,
+    grid_shape: tuple[int, int] = (2, 2),
+    max_queries_per_request: int = 8,
+) -> dict[str, list[float]]:
+    """
+    Like `detection_in_video`, but checks several descriptions at once. The video is
+    decoded once and every image is sent once per `max_queries_per_request`
+    descriptions instead of once per description.
+
+    Returns:
+        dict: Matched timestamps for each description.
+    """
+    llm = make_detector(method, model)
+    query_groups = list(chunked(prompt_inputs, max_queries_per_request))
+    pipeline = DetectionPipeline(
+        make_sampler(video_path),
+        make_multi_infer(llm, query_groups),
+        INFERENCE_ENGINE,
+        every_n_seconds=every_n_seconds,
+        max_frames=max_frames,
+        grid_shape=grid_shape if multiframe else (1, 1),
+        sampling=sampling,
+        scene_threshold=scene_threshold,
+        max_gap_seconds=max_gap_seconds,
+        dedup_threshold=dedup_threshold,
+    )
+
+    print(f"Querying Groq API with {len(query_groups)} requests per image for {len(prompt_inputs)} descriptions...")
+    temp = time.time()
+    matched_timestamps: dict[str, list[float]] = {prompt_input: [] for prompt_input in prompt_inputs}
+    for event in pipeline.run():
+        if event["event"] != "frame":
+            continue
+        span = format_span([event["timestamp"], event["end"]])
+        if "error" in event:
+            print(f"[!] Error at {span} sec: {event['error']}")
+            continue
+        for prompt_input, reply in zip(prompt_inputs, event["reply"]):
+            if isinstance(reply, Exception):
+                print(f"[!] Error at {span} sec ({prompt_input!r}): {reply}")
+            elif reply == "yes":
+                matched_timestamps[prompt_input].append(event["timestamp"])
+                print(f"[✓] {prompt_input!r} detected at {span} sec")
+            elif reply != "no":
+                print(f"RESPONSE ({span} sec, {prompt_input!r}): {reply}")
+    print(f"{time.time()-temp:.2f}s")
+
+    return {prompt_input: sorted(timestamps) for prompt_input, timestamps in matched_timestamps.items()}
+
 def detection_in_video_batched(
         video_path: str,
         prompt_input: str,
@@ -102,8 +325,11 @@ def detection_in_video_batched(
         multiframe: bool = False,
         batch_size: int = 4,
         api_key: str = GROQ_API_KEY,
+        sampling: Literal["fixed", "adaptive"] = "fixed",
+        scene_threshold: float = 0.05,
+        max_gap_seconds: float = 10.0,
+        grid_shape: tuple[int, int] = (2, 2),
     ):
-    sampler = VideoFrameSampler(video_path)
     if method == "detection":
         llm = LlamaImageDetector(api_key, model=model)
     elif method == "anomaly":
@@ -113,37 +339,39 @@ def detection_in_video_batched(
 
     # explainer = LLamaImageExplainer(GROQ_API_KEY, model=model)
 
-    frames_base64 = sampler.sample_frames(
-        every_n_seconds=every_n_seconds,
-        output_format="base64",
-        max_frames=max_frames,
-        multiframe=multiframe,
-    )
+    # One batch run for the whole video: frames are encoded as the batch files are
+    # written, the manager shards them `batch_size` to a batch and bounds the batches
+    # in flight. Polling can take hours, so it stays on this thread rather than
+    # holding INFERENCE_ENGINE workers that interactive requests need.
+    sampler = make_sampler(video_path)
+    tile_timestamps: list[list[float]] = []
+
+    def images() -> Iterator[str]:
+        for tiles, encoded in sampler.iter_grids(
+            every_n_seconds,
+            grid_shape if multiframe else (1, 1),
+            "encoded",
+            max_frames,
+            sampling=sampling,
+            scene_threshold=scene_threshold,
+            max_gap_seconds=max_gap_seconds,
+        ):
+            tile_timestamps.append(tiles)
+            yield encoded.data_url
+
+    replies = llm.batched_inference(images(), prompt_input, max_items_per_batch=batch_size)
 
     matched_timestamps = []
-    timestamps = [round(i * every_n_seconds * 4 if multiframe else i * every_n_seconds, 5) for i in range(len(frames_base64))]
-    for i, (batch_frames_base64, batch_timestamps) in enumerate(zip(chunked(frames_base64, batch_size), chunked(timestamps, batch_size))):
-        images = [f"data:image/jpeg;base64,{frame_base64}" for frame_base64 in batch_frames_base64]
-        try:
-            replies = llm.batched_inference(images, prompt_input)
-            for reply, timestamp_sec in zip(replies, batch_timestamps):
-                if reply.lower() == "yes":
-                    matched_timestamps.append(timestamp_sec)
-                    if multiframe:
-                        print(f"[✓] Object/Anomaly detected at {timestamp_sec}-{timestamp_sec+every_n_seconds*4} sec")
-                    else:
-                        print(f"[✓] Object/Anomaly detected at {timestamp_sec} sec")
-                elif reply == "no":
-                    if multiframe:
-                        print(f"[ ] No Object/Anomaly at {timestamp_sec}-{timestamp_sec+every_n_seconds*4} sec")
-                    else:
-                        print(f"[ ] No Object/Anomaly at {timestamp_sec} sec")
-                else:
-                    print(f"RESPONSE ({timestamp_sec} sec): {reply}")
-        except Exception as e:
-            print(f"[!] Error at frame {i} ({batch_timestamps[0]} sec): {e}")
-        
-    return matched_timestamps
+    for tiles, reply in zip(tile_timestamps, replies):
+        event = {"timestamp": tiles[0], "end": tiles[-1]}
+        if isinstance(reply, Exception):
+            event["error"] = str(reply)
+        else:
+            event["reply"] = reply
+        if report_frame(event, "Object/Anomaly"):
+            matched_timestamps.append(event["timestamp"])
+
+    return sorted(matched_timestamps)
 
 
 
@@ -153,87 +381,406 @@ def detect_event_in_video(
         every_n_seconds: float = 2.0,
         max_frames: int = 20,
         model: str = "meta-llama/llama-4-scout-17b-16e-instruct",
+        grid_shape: tuple[int, int] = (2, 2),
     ):
-    multiframe: bool = True
-    sampler = VideoFrameSampler(video_path)
-    interpreter = LlamaImageDetector(
-        GROQ_API_KEY, 
-        model=model, 
-        prompt_template=LlamaPromptTemplates.event_detection_prompt_template
-    )
+    interpreter = make_event_detector(model)
     # explainer = LLamaImageExplainer(GROQ_API_KEY, model=model)
 
-    frames_base64 = sampler.sample_frames(
+    pipeline = DetectionPipeline(
+        make_sampler(video_path),
+        lambda images: [interpreter.inference(image, event_description) for image in images],
+        INFERENCE_ENGINE,
         every_n_seconds=every_n_seconds,
-        output_format="base64",
         max_frames=max_frames,
-        multiframe=multiframe,
+        grid_shape=grid_shape,
+        dedup_threshold=None,
     )
 
     matched_timestamps = []
-    for i, frame_base64 in enumerate(frames_base64):
-        timestamp_sec = i * every_n_seconds * 4 if multiframe else i * every_n_seconds
-        timestamp_sec = round(timestamp_sec, 5)
-        image = f"data:image/jpeg;base64,{frame_base64}"
-        try:
-            reply = interpreter.inference(image, event_description)
-            if reply.lower() == "yes":
-                matched_timestamps.append(timestamp_sec)
-                print(f"[✓] Event detected at {timestamp_sec}-{timestamp_sec+every_n_seconds*4} sec")
-            elif reply == "no":
-                print(f"[ ] No event at {timestamp_sec}-{timestamp_sec+every_n_seconds*4} sec")
-                # explanation = explainer.explain(image)
-                # print(f"EXPLANATION: {explanation}")
-            else:
-                print(f"RESPONSE ({timestamp_sec}-{timestamp_sec+every_n_seconds*4} sec): {reply}")
-        except Exception as e:
-            print(f"[!] Error at frame {i} ({timestamp_sec}-{timestamp_sec+every_n_seconds*4}s): {e}")
-
-    return matched_timestamps
+    for event in pipeline.run():
+        if event["event"] == "frame" and report_frame(event, "Event"):
+            matched_timestamps.append(event["timestamp"])
 
+    return sorted(matched_timestamps)
 
-def transcribe_audio(filename):
-    audio_path = convert_video_to_audio_moviepy(filename)
-    client = Groq(api_key=GROQ_API_KEY)
-
-    with open(audio_path, "rb") as file:
-        transcription = None
-        try:
-            transcription = client.audio.transcriptions.create(
+def iter_monitor(
+    source: str | int,
+    prompt_input: str,
+    method: Literal["detection", "anomaly"] = "detection",
+    every_n_seconds: float = 1.0,
+    model: str = "meta-llama/llama-4-scout-17b-16e-instruct",
+    max_latency_seconds: float = 5.0,
+    max_in_flight: int = 2,
+    prefilter: Optional[str] = None,
+    follow: bool = False,
+    realtime: bool = False,
+    loop: bool = False,
+    duration_seconds: Optional[float] = None,
+    on_event: Optional[Callable[[dict], None]] = None,
+) -> Iterator[dict]:
+    """
+    Watch a live source (stream URL, webcam index or growing file) and yield a verdict
+    for its newest frame every `every_n_seconds`, dropping frames instead of falling
+    behind when inference is slower than the source. See `monitor.Monitor` for the
+    events and `max_latency_seconds`. Runs until the source ends, `duration_seconds`
+    pass or the generator is closed.
+    """
+    llm = make_detector(method, model, use_cache=False)
+    monitor = Monitor(
+        LiveFrameSampler(source, encoder=FRAME_ENCODER, follow=follow, realtime=realtime, loop=loop),
+        lambda image: llm.inference(image, prompt_input),
+        INFERENCE_ENGINE,
+        every_n_seconds=every_n_seconds,
+        max_in_flight=max_in_flight,
+        max_latency_seconds=max_latency_seconds,
+        cascade=build_cascade(prefilter) if prefilter else None,
+        on_event=on_event,
+        duration_seconds=duration_seconds,
+    )
+    print(f"Monitoring {monitor.source_label}...")
+    yield from monitor.run()
 
-            file=(audio_path, file.read()),
+def iter_detection_bulk(
+    video_paths: list[str],
+    prompt_inputs: list[str],
+    report_path: str = "bulk_report.jsonl",
+    method: Literal["detection", "anomaly"] = "detection",
+    every_n_seconds: float = 2.0,
+    max_frames: int = 20,
+    model: str = "meta-llama/llama-4-scout-17b-16e-instruct",
+    multiframe: bool = False,
+    sampling: Literal["fixed", "adaptive"] = "fixed",
+    scene_threshold: float = 0.05,
+    max_gap_seconds: float = 10.0,
+    dedup_threshold: Optional[int] = 5,
+    grid_shape: tuple[int, int] = (2, 2),
+    prefilter: Optional[str] = None,
+    max_videos: int = 2,
+    max_queries_per_request: int = 8,
+    keyframes_only: bool = False,
+) -> Iterator[dict]:
+    """
+    Scan many videos for several descriptions, `max_videos` at a time. All videos share
+    INFERENCE_ENGINE and SCHEDULER, so the concurrency and rate budget cover the whole
+    run, and each video's record (matched timestamps per description) is appended to the
+    JSONL report at `report_path` as soon as it finishes. Calling again with the same
+    report and settings resumes: finished videos are skipped, and frames already
+    answered in an interrupted video come from INFERENCE_CACHE. See `bulk.BulkRunner`
+    for the events.
+    """
+    llm = make_detector(method, model)
+    query_groups = list(chunked(prompt_inputs, max_queries_per_request))
+    infer = make_multi_infer(llm, query_groups)
+    grid_shape = grid_shape if multiframe else (1, 1)
+    config = {
+        "prompts": prompt_inputs, "method": method, "model": model, "every_n_seconds": every_n_seconds,
+        "max_frames": max_frames, "grid_shape": grid_shape, "sampling": sampling, "scene_threshold": scene_threshold,
+        "max_gap_seconds": max_gap_seconds, "dedup_threshold": dedup_threshold, "prefilter": prefilter,
+        "keyframes_only": keyframes_only,
+    }
+
+    def analyze(video_path: str) -> Iterator[dict]:
+        pipeline = DetectionPipeline(
+            make_sampler(video_path, keyframes_only),
+            infer,
+            INFERENCE_ENGINE,
+            every_n_seconds=every_n_seconds,
+            max_frames=max_frames,
+            grid_shape=grid_shape,
+            sampling=sampling,
+            scene_threshold=scene_threshold,
+            max_gap_seconds=max_gap_seconds,
+            dedup_threshold=dedup_threshold,
+            # Prefilter gates keep state between frames, so each video gets its own
+            cascade=build_cascade(prefilter) if prefilter else None,
+            # Videos share the engine; each keeps only its share of the requests queued
+            max_in_flight=INFERENCE_ENGINE.max_concurrency,
+        )
+        matched_timestamps: dict[str, list[float]] = {prompt_input: [] for prompt_input in prompt_inputs}
+        for event in pipeline.run():
+            if event["event"] == "frame":
+                if event.get("filtered"):
+                    # The cascade's "no" stands for every description
+                    event.pop("reply", None)
+                    event["matched"] = []
+                elif "reply" in event:
+                    replies = event.pop("reply")
+                    event["matched"] = [p for p, reply in zip(prompt_inputs, replies) if reply == "yes"]
+                    errors = [str(reply) for reply in replies if isinstance(reply, Exception)]
+                    if errors:
+                        event["error"] = errors[0]
+                    for prompt_input in event["matched"]:
+                        matched_timestamps[prompt_input].append(event["timestamp"])
+            elif event["event"] == "summary":
+                event["timestamps"] = {p: sorted(timestamps) for p, timestamps in matched_timestamps.items()}
+            yield event
+
+    runner = BulkRunner(video_paths, analyze, BulkReport(report_path), config, max_videos=max_videos)
+    yield from runner.run()
+
+def merge_windows(windows: list[tuple[float, float]], max_gap_seconds: float = 0.0) -> list[dict]:
+    """
+    Merge (start, end) windows that overlap, or are at most `max_gap_seconds` apart,
+    into {"start", "end", "windows"} segments in time order.
+    """
+    segments: list[dict] = []
+    for start, end in sorted(windows):
+        if segments and start <= segments[-1]["end"] + max_gap_seconds:
+            segments[-1]["end"] = max(segments[-1]["end"], end)
+            segments[-1]["windows"] += 1
+        else:
+            segments.append({"start": start, "end": end, "windows": 1})
+    return segments
 
-            model="whisper-large-v3",
-            prompt='Make sure to transcribe any sound effects in the background of the audio, to make it accessible for deaf audiences.',
+def detect_event_segments(
+        video_path: str,
+        event_description: str,
+        every_n_seconds: float = 1.0,
+        window_size: int = 4,
+        stride: int = 2,
+        max_frames: Optional[int] = None,
+        model: str = "meta-llama/llama-4-scout-17b-16e-instruct",
+        merge_gap_seconds: Optional[float] = None,
+    ) -> list[dict]:
+    """
+    Sliding-window event detection. Windows of `window_size` consecutive frames start
+    every `stride` frames, so an event that straddles the boundary between two
+    back-to-back grids still falls inside one window. Each window is sent as one grid,
+    and windows are dispatched concurrently. Overlapping windows reuse decoded frames
+    from a ring buffer rather than decoding them again.
+
+    Args:
+        merge_gap_seconds (float): Positive windows this close are joined into one
+            segment; defaults to `every_n_seconds`, i.e. windows with adjacent frames.
+
+    Returns:
+        list: Event segments as {"start", "end", "windows"}, in seconds, where "windows"
+            counts the positive windows merged into the segment.
+    """
+    interpreter = make_event_detector(model)
+    pipeline = DetectionPipeline(
+        make_sampler(video_path),
+        lambda images: [interpreter.inference(image, event_description) for image in images],
+        INFERENCE_ENGINE,
+        every_n_seconds=every_n_seconds,
+        max_frames=max_frames,
+        grid_shape=grid_shape_for(window_size),
+        dedup_threshold=None,
+        window_size=window_size,
+        stride=stride,
+    )
 
-            response_format="verbose_json",  # Optional
-            
+    positive_windows = []
+    for event in pipeline.run():
+        if event["event"] == "frame" and report_frame(event, "Event"):
+            positive_windows.append((event["timestamp"], event["end"]))
 
-            timestamp_granularities = ["segment"],
-            language="en",  # Optional
+    segments = merge_windows(positive_windows, every_n_seconds if merge_gap_seconds is None else merge_gap_seconds)
+    for segment in segments:
+        print(f"[✓] Event from {segment['start']} to {segment['end']} sec ({segment['windows']} windows)")
+    return segments
 
-            temperature=0.0  # Optional
 
+def search_detection_segments(
+        video_path: str,
+        prompt_input: str,
+        method: Literal["detection", "anomaly"] = "detection",
+        coarse_every_n_seconds: float = 8.0,
+        resolution_seconds: float = 1.0,
+        model: str = "meta-llama/llama-4-scout-17b-16e-instruct",
+        probe_retries: int = 2,
+    ) -> list[tuple[float, float]]:
+    """
+    Coarse-to-fine search for the time ranges where the object/anomaly is present.
+
+    Probes the video every `coarse_every_n_seconds`, then repeatedly bisects only the
+    intervals whose two ends disagree (one positive, one negative) until every boundary
+    is pinned down to `resolution_seconds`. All probes of one refinement level run
+    concurrently. Events shorter than the coarse interval that fall between two
+    negative probes can be missed.
+
+    A probe whose request fails is retried up to `probe_retries` times. If it still
+    fails it counts as unknown rather than "no": it is skipped when looking for
+    boundaries and segments, and an interval whose midpoint is unknown stops being
+    bisected.
+
+    Returns:
+        list: (start, end) of every positive segment, in seconds.
+    """
+    sampler = make_sampler(video_path)
+    llm = make_detector(method, model)
+
+    # None marks a probe that kept failing: it is neither a "yes" nor a "no"
+    verdicts: dict[float, Optional[bool]] = {}
+
+    def probe(timestamps: list[float]):
+        frames = dict(zip(timestamps, sampler.frames_at(timestamps, output_format="encoded")))
+        pending = list(timestamps)
+        for attempt in range(probe_retries + 1):
+            replies = INFERENCE_ENGINE.map(
+                lambda image: llm.inference(image, prompt_input),
+                [frames[timestamp_sec].data_url for timestamp_sec in pending],
+                return_exceptions=True,
             )
-        except Exception as e:
-            print(f"Error {e}")
-
-        for segment in transcription.segments:
-            print(segment['start'], "-", segment['end'], ': ')
-            print(segment['text'])
-        return transcription.segments
-
-def convert_video_to_audio_moviepy(video_file, output_ext="mp3"):
-    """Converts video to audio using MoviePy library
-    that uses `ffmpeg` under the hood"""
-    filename, ext = os.path.splitext(video_file)
-    clip = VideoFileClip(video_file)
-    if clip.audio: 
-        clip.audio.write_audiofile(f"{filename}.{output_ext}")
-    else:
-        raise Exception(f"clip.audio is None. {clip.audio}")
-    
-    return (f"{filename}.{output_ext}")
+            failed = []
+            for timestamp_sec, reply in zip(pending, replies):
+                if isinstance(reply, Exception):
+                    print(f"[!] Error at {timestamp_sec} sec (attempt {attempt + 1}): {reply}")
+                    failed.append(timestamp_sec)
+                else:
+                    verdicts[timestamp_sec] = reply == "yes"
+            pending = failed
+            if not pending:
+                break
+        for timestamp_sec in pending:
+            verdicts[timestamp_sec] = None
+
+    last_timestamp = max(0.0, (sampler.total_frames - 1) / sampler.fps)
+    coarse = [round(i * coarse_every_n_seconds, 5) for i in range(int(last_timestamp // coarse_every_n_seconds) + 1)]
+    if coarse[-1] < last_timestamp:
+        coarse.append(round(last_timestamp, 5))
+    probe(coarse)
+
+    # Unknown probes are left out, so their neighbours bracket the boundary instead
+    known = [t for t in coarse if verdicts[t] is not None]
+    intervals = [(a, b) for a, b in zip(known, known[1:]) if verdicts[a] != verdicts[b]]
+    unresolved = []
+    while intervals:
+        intervals = [(a, b) for a, b in intervals if b - a > resolution_seconds]
+        midpoints = [round((a + b) / 2, 5) for a, b in intervals]
+        if not midpoints:
+            break
+        probe(midpoints)
+        next_intervals = []
+        for (a, b), m in zip(intervals, midpoints):
+            if verdicts[m] is None:
+                # The boundary is somewhere in (a, b) but can't be narrowed further
+                unresolved.append((a, b))
+                continue
+            if verdicts[a] != verdicts[m]:
+                next_intervals.append((a, m))
+            if verdicts[m] != verdicts[b]:
+                next_intervals.append((m, b))
+        intervals = next_intervals
+
+    segments = []
+    start = None
+    probed = sorted(t for t, verdict in verdicts.items() if verdict is not None)
+    for timestamp_sec in probed:
+        if verdicts[timestamp_sec] and start is None:
+            start = timestamp_sec
+        elif not verdicts[timestamp_sec] and start is not None:
+            segments.append((start, previous))
+            start = None
+        previous = timestamp_sec
+    if start is not None:
+        segments.append((start, probed[-1]))
+
+    failed_probes = sum(verdict is None for verdict in verdicts.values())
+    if failed_probes:
+        print(f"[!] {failed_probes} probes failed and were ignored; {len(unresolved)} boundaries are only known to within their coarser interval")
+    dense_calls = int(last_timestamp / resolution_seconds) + 1
+    print(f"Searched with {len(verdicts)} LLM calls (dense sampling at {resolution_seconds}s would need {dense_calls})")
+    for start, end in segments:
+        print(f"[✓] Object/Anomaly present from {start} to {end} sec")
+    return segments
+
+
+def transcribe_audio(
+        filename: str,
+        language: Optional[str] = "en",
+        chunk_seconds: float = 120.0,
+        overlap_seconds: float = 2.0,
+        split: Literal["silence", "fixed"] = "silence",
+) -> list[dict]:
+    """
+    Transcribe a video's audio track; long audio is split into chunks that are
+    transcribed concurrently and stitched back into one list of segments.
+    """
+    transcriber = AudioTranscriber(
+        get_shared_client(GROQ_API_KEY),
+        INFERENCE_ENGINE,
+        language=language,
+        prompt="Make sure to transcribe any sound effects in the background of the audio, to make it accessible for deaf audiences.",
+        chunk_seconds=chunk_seconds,
+        overlap_seconds=overlap_seconds,
+        split=split,
+    )
+    segments = transcriber.transcribe(filename)
+    for segment in segments:
+        print(segment["start"], "-", segment["end"], ": ")
+        print(segment["text"])
+    return segments
+
+def align_detections(timestamps: list[float], segments: list[dict]) -> list[dict]:
+    """Attach to every transcript segment the detection timestamps that fall inside it."""
+    aligned = []
+    for segment in segments:
+        inside = [t for t in timestamps if segment["start"] <= t < segment["end"]]
+        aligned.append({**segment, "detections": inside})
+    return aligned
+
+def analyze_video(
+        video_path: str,
+        prompt_input: str,
+        method: Literal["detection", "anomaly"] = "detection",
+        every_n_seconds: float = 2.0,
+        max_frames: int = 20,
+        model: str = "meta-llama/llama-4-scout-17b-16e-instruct",
+        multiframe: bool = False,
+        sampling: Literal["fixed", "adaptive"] = "fixed",
+        scene_threshold: float = 0.05,
+        max_gap_seconds: float = 10.0,
+        language: Optional[str] = "en",
+        chunk_seconds: float = 120.0,
+        overlap_seconds: float = 2.0,
+) -> dict:
+    """
+    Run visual detection and audio transcription on one video at the same time, so the
+    total wall time is close to the slower of the two rather than their sum. The two
+    pipelines don't share a demux: each opens the file with its own decoder, and the
+    audio pass skips the video packets without decoding them.
+
+    Returns:
+        dict: {"timestamps": matched frame timestamps, "segments": transcript segments,
+            each with the "detections" inside it, "audio_error": set when the video has
+            no audio track, and per-pipeline timings in seconds}.
+    """
+    start = time.time()
+
+    def timed(fn, *args, **kwargs):
+        fn_start = time.time()
+        result = fn(*args, **kwargs)
+        return result, round(time.time() - fn_start, 3)
+
+    # A separate pool: both pipelines fan their API calls out onto INFERENCE_ENGINE
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="analyze") as executor:
+        visual = executor.submit(
+            contextvars.copy_context().run, timed, detection_in_video,
+            video_path, prompt_input, method, every_n_seconds, max_frames, model, multiframe,
+            sampling, scene_threshold, max_gap_seconds,
+        )
+        audio = executor.submit(
+            contextvars.copy_context().run, timed, transcribe_audio,
+            video_path, language=language, chunk_seconds=chunk_seconds, overlap_seconds=overlap_seconds,
+        )
+        timestamps, visual_seconds = visual.result()
+        audio_error = None
+        try:
+            segments, audio_seconds = audio.result()
+        except NoAudioTrackError as e:
+            # No audio track: still return the visual results
+            segments, audio_seconds, audio_error = [], None, str(e)
+
+    return {
+        "timestamps": timestamps,
+        "segments": align_detections(timestamps, segments),
+        "audio_error": audio_error,
+        "visual_seconds": visual_seconds,
+        "audio_seconds": audio_seconds,
+        "elapsed": round(time.time() - start, 3),
+    }
+
 if __name__ ==  "__main__":
     detected_timestamps = detection_in_video(
         video_path="sample_data/IMG_5362.MOV",
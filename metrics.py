@@ -0,0 +1,221 @@
+import bisect
+from contextlib import contextmanager
+import contextvars
+import logging
+import threading
+import time
+import uuid
+from typing import Any, Iterable, Iterator, Optional
+
+# Seconds; stages range from sub-millisecond colour conversions to multi-second inference calls
+DEFAULT_BUCKETS: tuple[float, ...] = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+def _format_labels(labelnames: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    """Monotonic counter, optionally split by labels."""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: Any):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def collect(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value:g}")
+        return lines
+
+class Gauge:
+    """Last-set value, optionally split by labels."""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, **labels: Any):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+    def collect(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value:g}")
+        return lines
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally split by labels."""
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Iterable[str] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> (per-bucket counts with a final +Inf slot, sum)
+        self._values: dict[tuple[str, ...], tuple[list[int], float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: Any):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def collect(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip((*self.buckets, float("inf")), counts):
+                    cumulative += count
+                    le = 'le="+Inf"' if bound == float("inf") else f'le="{bound:g}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total:.6f}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics: list[Counter | Gauge | Histogram] = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Prometheus text exposition format."""
+        return "\n".join(line for metric in self.metrics for line in metric.collect()) + "\n"
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "llamavid_stage_seconds",
+    "Time per pipeline stage: one observation per frame, grid or API call",
+    ["stage"],
+))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "llamavid_request_seconds", "End-to-end HTTP request time", ["route", "status"],
+))
+TOKENS = REGISTRY.register(Counter("llamavid_tokens_total", "Tokens reported by completion responses", ["kind"]))
+GROQ_REQUESTS = REGISTRY.register(Counter("llamavid_groq_requests_total", "Chat-completion calls by outcome", ["outcome"]))
+RETRIES = REGISTRY.register(Counter("llamavid_retries_total", "Retried chat-completion calls", ["reason"]))
+CACHE_LOOKUPS = REGISTRY.register(Counter("llamavid_inference_cache_total", "Inference cache lookups", ["result"]))
+MONITOR_LAG = REGISTRY.register(Histogram(
+    "llamavid_monitor_lag_seconds", "Monitor mode: time from grabbing a frame to its verdict",
+))
+MONITOR_LAST_LAG = REGISTRY.register(Gauge(
+    "llamavid_monitor_last_lag_seconds", "Monitor mode: lag of the most recent verdict", ["source"],
+))
+MONITOR_FRAMES = REGISTRY.register(Counter(
+    "llamavid_monitor_frames_total", "Monitor mode: sampled frames by outcome", ["outcome"],
+))
+
+class Trace:
+    """Per-request stage totals, shared by every thread working on the request."""
+
+    def __init__(self, trace_id: Optional[str] = None):
+        self.trace_id = trace_id if trace_id else uuid.uuid4().hex[:16]
+        self.started = time.perf_counter()
+        self.stages: dict[str, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            totals = self.stages.setdefault(stage, [0.0, 0])
+            totals[0] += seconds
+            totals[1] += 1
+
+    def summary(self) -> dict[str, dict]:
+        """{stage: {"seconds": total, "count": observations}}, plus the elapsed wall time."""
+        with self._lock:
+            stages = {stage: {"seconds": round(total, 4), "count": count} for stage, (total, count) in self.stages.items()}
+        return {"trace_id": self.trace_id, "elapsed": round(time.perf_counter() - self.started, 4), "stages": stages}
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("llamavid_trace", default=None)
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+def set_current_trace(trace: Optional[Trace]):
+    """
+    Make `trace` the current one. Streamed responses are iterated outside the view's
+    context, so their generators set the request's trace again before doing any work.
+    """
+    _current_trace.set(trace)
+
+def start_trace(trace_id: Optional[str] = None) -> Trace:
+    trace = Trace(trace_id)
+    _current_trace.set(trace)
+    return trace
+
+def end_trace():
+    _current_trace.set(None)
+
+def record(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(stage, seconds)
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+def record_completion(response: Any, round_trip: float):
+    """
+    Record a chat completion's tokens and timing. Groq reports its own queue and
+    processing time in `usage`; that is the "inference" stage and the rest of the
+    round trip (mostly sending the image) is "upload". Without server timings the
+    whole round trip counts as inference.
+    """
+    GROQ_REQUESTS.inc(outcome="ok")
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        record("inference", round_trip)
+        return
+    TOKENS.inc(usage.prompt_tokens or 0, kind="prompt")
+    TOKENS.inc(usage.completion_tokens or 0, kind="completion")
+    server_time = (getattr(usage, "queue_time", None) or 0.0) + (getattr(usage, "total_time", None) or 0.0)
+    if server_time and server_time <= round_trip:
+        record("inference", server_time)
+        record("upload", round_trip - server_time)
+    else:
+        record("inference", round_trip)
+
+class TraceIdFilter(logging.Filter):
+    """Adds `trace_id` to log records ("-" outside a traced request)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        trace = _current_trace.get()
+        record.trace_id = trace.trace_id if trace is not None else "-"
+        return True
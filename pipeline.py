@@ -0,0 +1,345 @@
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+import contextvars
+import queue
+import threading
+import time
+from typing import Any, Callable, Iterator, Literal, Optional, Sequence
+
+import numpy as np
+
+from llm import InferenceEngine
+from prefilter import Outcome, PrefilterCascade
+from videoparser import EncodedFrame, VideoFrameSampler, hamming_distance, perceptual_hash
+
+# Marks the end of a stage's output
+_DONE = object()
+# Reply placeholder for a representative whose request is still in flight
+_PENDING = object()
+
+class _Failure:
+    """Carries an exception raised in a stage thread to the consumer."""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+class DetectionPipeline:
+    """
+    Streams a video through decode -> encode -> infer with bounded queues between the
+    stages, so peak memory depends on the queue sizes and requests in flight rather
+    than on the length of the video.
+
+    Decoding and grid composition/encoding run on their own threads. The consumer of
+    `run` drives inference: it deduplicates frames against recent representatives,
+    submits requests to `engine` and stops pulling frames while `max_in_flight`
+    requests are outstanding, which in turn blocks the encoder and decoder once their
+    queues fill up. Aggregating the replies is left to whoever iterates `run`.
+
+    Args:
+        infer_batch (callable): Takes a list of image data URLs (at most `batch_size`)
+            and returns one reply per image; exceptions in the list mark failed items.
+        dedup_threshold (int): Frames within this many pHash bits of one of the last
+            `dedup_window` representatives reuse its reply. None disables dedup.
+        stride (int): Build sliding windows of `window_size` frames (default: one grid's
+            worth), one every `stride` sampled frames, instead of back-to-back grids.
+            Overlapping windows share decoded frames through the sampler's ring buffer.
+        cascade (PrefilterCascade): Frames it rejects are reported as filtered and never
+            encoded for inference. Frames it marks as repeats (e.g. no motion) reuse the
+            reply of the last frame sent through, and are sent themselves when that
+            frame has no successful reply to reuse.
+        queue_size (int): Encoded grids buffered ahead of inference.
+        decode_queue_size (int): Decoded frame groups buffered ahead of the encoder. These
+            are raw BGR arrays (about 6 MB per 1080p frame), so the buffer is kept short.
+        cache_max_bytes (int): Encoded grids are saved to the sampler's frame cache only
+            while they fit in this budget, so caching doesn't reintroduce a copy of the
+            whole video in memory.
+    """
+
+    def __init__(
+        self,
+        sampler: VideoFrameSampler,
+        infer_batch: Callable[[list[str]], Sequence[Any]],
+        engine: InferenceEngine,
+        every_n_seconds: float = 2.0,
+        max_frames: Optional[int] = 20,
+        grid_shape: tuple[int, int] = (1, 1),
+        sampling: Literal["fixed", "adaptive"] = "fixed",
+        scene_threshold: float = 0.05,
+        max_gap_seconds: float = 10.0,
+        dedup_threshold: Optional[int] = 5,
+        dedup_window: int = 256,
+        window_size: Optional[int] = None,
+        stride: Optional[int] = None,
+        cascade: Optional[PrefilterCascade] = None,
+        batch_size: int = 1,
+        max_in_flight: Optional[int] = None,
+        queue_size: int = 8,
+        decode_queue_size: int = 2,
+        cache_max_bytes: int = 32 << 20,
+    ):
+        self.sampler = sampler
+        self.infer_batch = infer_batch
+        self.engine = engine
+        self.every_n_seconds = every_n_seconds
+        self.max_frames = max_frames
+        self.grid_shape = grid_shape
+        self.sampling = sampling
+        self.scene_threshold = scene_threshold
+        self.max_gap_seconds = max_gap_seconds
+        self.dedup_threshold = dedup_threshold
+        self.dedup_window = dedup_window
+        self.window_size = window_size if window_size else grid_shape[0] * grid_shape[1]
+        self.stride = stride
+        self.cascade = cascade
+        self.batch_size = batch_size
+        # Twice the engine's workers keeps every worker busy while replies are handled
+        self.max_in_flight = max_in_flight if max_in_flight else 2 * engine.max_concurrency
+        self.queue_size = queue_size
+        self.decode_queue_size = decode_queue_size
+        self.cache_max_bytes = cache_max_bytes
+        self._stop = threading.Event()
+
+    def _put(self, q: queue.Queue, item: Any) -> bool:
+        """Blocking put that gives up once the pipeline is stopped."""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _drain(self, q: queue.Queue) -> Iterator[Any]:
+        """Items from an upstream stage until it finishes; re-raises its failure."""
+        while not self._stop.is_set():
+            try:
+                item = q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+
+    def _start_stage(self, produce: Callable[[], Iterator[Any]], out: queue.Queue, name: str) -> threading.Thread:
+        def run():
+            try:
+                for item in produce():
+                    if not self._put(out, item):
+                        return
+                self._put(out, _DONE)
+            except BaseException as e:
+                self._put(out, _Failure(e))
+
+        # Stage threads record into the caller's trace
+        thread = threading.Thread(target=contextvars.copy_context().run, args=(run,), name=name, daemon=True)
+        thread.start()
+        return thread
+
+    def _decode(self) -> Iterator[list[tuple[int, np.ndarray]]]:
+        if self.stride:
+            yield from self.sampler.iter_frame_windows(
+                every_n_seconds=self.every_n_seconds,
+                window_size=self.window_size,
+                stride=self.stride,
+                max_frames=self.max_frames,
+                sampling=self.sampling,
+                scene_threshold=self.scene_threshold,
+                max_gap_seconds=self.max_gap_seconds,
+            )
+            return
+        yield from self.sampler.iter_frame_groups(
+            every_n_seconds=self.every_n_seconds,
+            grid_shape=self.grid_shape,
+            max_frames=self.max_frames,
+            sampling=self.sampling,
+            scene_threshold=self.scene_threshold,
+            max_gap_seconds=self.max_gap_seconds,
+        )
+
+    def _encode(self, groups: queue.Queue, cache_key: Optional[str]) -> Iterator[tuple[list[float], Optional[EncodedFrame], Outcome]]:
+        """Yields (tile timestamps, encoded grid, cascade outcome), with None for grids the cascade rejected."""
+        cached_timestamps: Optional[list[list[float]]] = [] if cache_key else None
+        cached_grids: list[EncodedFrame] = []
+        cached_bytes = 0
+        for group in self._drain(groups):
+            tiles = [round(frame_idx / self.sampler.fps, 5) for frame_idx, _ in group]
+            grid = self.sampler.compose_group(group, self.grid_shape)
+            outcome = self.cascade.classify(grid) if self.cascade is not None else "forward"
+            # Repeats are encoded too, in case there is no reply for them to reuse
+            passed = outcome != "reject"
+            # Rejected grids are only encoded while they still have to go into the cache
+            encoded = self.sampler.encoder.encode(grid) if passed or cached_timestamps is not None else None
+            if cached_timestamps is not None:
+                cached_bytes += len(encoded)
+                if cached_bytes > self.cache_max_bytes:
+                    cached_timestamps, cached_grids = None, []
+                else:
+                    cached_timestamps.append(tiles)
+                    cached_grids.append(encoded)
+            yield tiles, encoded if passed else None, outcome
+        if cached_timestamps is not None and not self._stop.is_set():
+            self.sampler.frame_cache.set(cache_key, (cached_timestamps, cached_grids))
+
+    def _replay(self, cached: tuple[list[list[float]], list[EncodedFrame]]) -> Iterator[tuple[list[float], Optional[EncodedFrame], Outcome]]:
+        for tiles, encoded in zip(*cached):
+            outcome = self.cascade.classify(encoded) if self.cascade is not None else "forward"
+            yield tiles, encoded if outcome != "reject" else None, outcome
+
+    def run(self) -> Iterator[dict]:
+        """
+        Yields:
+            - {"event": "start", "frames"}: planned number of images (an upper bound with
+              adaptive sampling)
+            - {"event": "frame", "timestamp", "end", "reply"} per image, in completion
+              order, with "error" instead of "reply" when its request failed,
+              "filtered": True and reply "no" when the cascade rejected it, and
+              "repeated": True when it reused the last forwarded frame's reply
+            - {"event": "progress", "done", "total"} after every batch of frame events
+            - {"event": "summary", "frames", "requests", "errors", "elapsed"} last, plus
+              "prefilter" stats when a cascade is set
+        """
+        start = time.time()
+        self._stop.clear()
+        threads = []
+        frames_queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+
+        cache_key = self.sampler.grid_cache_key(
+            self.every_n_seconds, self.grid_shape, self.max_frames, None,
+            self.sampling, self.scene_threshold, self.max_gap_seconds,
+            (self.window_size, self.stride) if self.stride else None,
+        )
+        cached = self.sampler.frame_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            planned = len(cached[0])
+            threads.append(self._start_stage(lambda: self._replay(cached), frames_queue, "pipeline-replay"))
+        else:
+            if self.stride:
+                planned = self.sampler.planned_windows(self.every_n_seconds, self.window_size, self.stride, self.max_frames)
+            else:
+                rows, cols = self.grid_shape
+                planned = -(-self.sampler.planned_samples(self.every_n_seconds, self.max_frames) // (rows * cols))
+            groups_queue: queue.Queue = queue.Queue(maxsize=self.decode_queue_size)
+            threads.append(self._start_stage(self._decode, groups_queue, "pipeline-decode"))
+            threads.append(self._start_stage(lambda: self._encode(groups_queue, cache_key), frames_queue, "pipeline-encode"))
+
+        # Recent representatives for dedup: id -> [pHash, reply or _PENDING]
+        recent: OrderedDict[int, list] = OrderedDict()
+        # Frames waiting on an in-flight representative: id -> (tile timestamps, extra event fields) per frame
+        waiting: dict[int, list[tuple[list[float], dict]]] = {}
+        # The last representative whose reply frames went out with, for cascade repeats: [id, reply or _PENDING]
+        last_sent: Optional[list] = None
+        in_flight: dict[Future, list[int]] = {}
+        batch: list[tuple[int, str]] = []
+        counts = {"frames": 0, "done": 0, "requests": 0, "errors": 0}
+
+        def emit(frames: list[tuple[list[float], dict]], reply: Any) -> Iterator[dict]:
+            for tiles, extra in frames:
+                event = {"event": "frame", "timestamp": tiles[0], "end": tiles[-1], **extra}
+                if isinstance(reply, Exception):
+                    counts["errors"] += 1
+                    event.update(error=str(reply))
+                else:
+                    event.update(reply=reply)
+                yield event
+            counts["done"] += len(frames)
+            yield {"event": "progress", "done": counts["done"], "total": max(planned, counts["frames"])}
+
+        def submit():
+            ids = [rep for rep, _ in batch]
+            images = [image for _, image in batch]
+            in_flight[self.engine.submit(self.infer_batch, images)] = ids
+            counts["requests"] += 1
+            batch.clear()
+
+        def collect(futures) -> Iterator[dict]:
+            nonlocal last_sent
+            for future in futures:
+                ids = in_flight.pop(future)
+                try:
+                    replies = list(future.result())
+                except Exception as e:
+                    replies = [e] * len(ids)
+                for rep, reply in zip(ids, replies):
+                    # Only successful replies are reused: after a failure, the next
+                    # duplicate or repeat frame is sent again
+                    if isinstance(reply, Exception):
+                        recent.pop(rep, None)
+                        if last_sent is not None and last_sent[0] == rep:
+                            last_sent = None
+                    else:
+                        if rep in recent:
+                            recent[rep][1] = reply
+                        if last_sent is not None and last_sent[0] == rep:
+                            last_sent[1] = reply
+                    # Frames already waiting on it share its outcome, failure included
+                    yield from emit(waiting.pop(rep), reply)
+
+        yield {"event": "start", "frames": planned}
+        try:
+            for rep, (tiles, encoded, outcome) in enumerate(self._drain(frames_queue)):
+                counts["frames"] += 1
+                if outcome == "repeat" and last_sent is not None:
+                    if last_sent[1] is _PENDING:
+                        waiting[last_sent[0]].append((tiles, {"repeated": True}))
+                    else:
+                        yield from emit([(tiles, {"repeated": True})], last_sent[1])
+                    continue
+                if encoded is None:
+                    yield from emit([(tiles, {"filtered": True})], "no")
+                    continue
+
+                if self.dedup_threshold is not None:
+                    frame_hash = perceptual_hash(encoded)
+                    match = next(
+                        (other for other, (other_hash, _) in recent.items()
+                         if hamming_distance(other_hash, frame_hash) <= self.dedup_threshold),
+                        None,
+                    )
+                    if match is not None:
+                        reply = recent[match][1]
+                        last_sent = [match, reply]
+                        if reply is _PENDING:
+                            waiting[match].append((tiles, {}))
+                        else:
+                            yield from emit([(tiles, {})], reply)
+                        continue
+                    recent[rep] = [frame_hash, _PENDING]
+                    if len(recent) > self.dedup_window:
+                        recent.popitem(last=False)
+
+                waiting[rep] = [(tiles, {})]
+                last_sent = [rep, _PENDING]
+                batch.append((rep, encoded.data_url))
+                encoded.drop_cached()
+                if len(batch) >= self.batch_size:
+                    submit()
+                # Backpressure: stop pulling frames until a request slot frees up
+                while len(in_flight) >= self.max_in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    yield from collect(done)
+
+            if batch:
+                submit()
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                yield from collect(done)
+        finally:
+            # The consumer stopped early or a stage failed: unblock and drop everything queued
+            self._stop.set()
+            for future in in_flight:
+                future.cancel()
+            for thread in threads:
+                thread.join()
+
+        summary = {
+            "event": "summary",
+            "frames": counts["frames"],
+            "requests": counts["requests"],
+            "errors": counts["errors"],
+            "elapsed": round(time.time() - start, 3),
+        }
+        if self.cascade is not None:
+            summary["prefilter"] = self.cascade.stats()
+        yield summary
@@ -0,0 +1,208 @@
+from abc import ABC, abstractmethod
+from typing import Callable, Literal, Optional, Sequence
+
+import cv2
+import numpy as np
+
+import metrics
+from videoparser import EncodedFrame
+
+Outcome = Literal["forward", "reject", "repeat"]
+
+class Gate(ABC):
+    """
+    A cheap, CPU-only check run before a frame is sent to the LLM. `check` returns
+    False to keep the frame from the LLM. What that means depends on `on_reject`:
+    "reject" gates say the frame cannot possibly match, so it is reported as a
+    non-match; "repeat" gates say it looks like the frame before, so it inherits the
+    last verdict. Gates see frames in timestamp order, and `stateful` gates (whose
+    verdict depends on earlier frames) are run on every frame.
+    """
+    name: str = "gate"
+    on_reject: Literal["reject", "repeat"] = "reject"
+    stateful: bool = False
+
+    @abstractmethod
+    def check(self, frame_bgr: np.ndarray) -> bool:
+        ...
+
+class MotionGate(Gate):
+    """
+    Passes frames whose mean absolute difference from the previous sampled frame is at
+    least `threshold` (0-1). A still frame shows the same scene as the one before, so
+    it repeats that frame's verdict rather than counting as a non-match.
+    """
+    name = "motion"
+    on_reject = "repeat"
+    stateful = True
+
+    def __init__(self, threshold: float = 0.02, size: tuple[int, int] = (160, 90)):
+        self.threshold = threshold
+        self.size = size
+        self.previous: Optional[np.ndarray] = None
+
+    def check(self, frame_bgr: np.ndarray) -> bool:
+        gray = cv2.cvtColor(cv2.resize(frame_bgr, self.size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        gray = cv2.GaussianBlur(gray, (5, 5), 0)
+        previous, self.previous = self.previous, gray
+        # Nothing to compare the first frame with, so it always goes through
+        if previous is None:
+            return True
+        return float(cv2.absdiff(previous, gray).mean()) / 255.0 >= self.threshold
+
+class PersonGate(Gate):
+    """Passes frames where OpenCV's HOG pedestrian detector finds someone with at least `min_confidence`."""
+    name = "person"
+
+    def __init__(self, min_confidence: float = 0.5, max_side: int = 640, upscale_below: int = 320):
+        self.min_confidence = min_confidence
+        self.max_side = max_side
+        # The detector window is 64x128, so small frames are enlarged to catch people in them
+        self.upscale_below = upscale_below
+        self.hog = cv2.HOGDescriptor()
+        self.hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+
+    def check(self, frame_bgr: np.ndarray) -> bool:
+        h, w = frame_bgr.shape[:2]
+        longest = max(h, w)
+        if longest > self.max_side:
+            scale = self.max_side / longest
+        elif longest < self.upscale_below:
+            scale = self.upscale_below / longest
+        else:
+            scale = 1.0
+        if scale != 1.0:
+            frame_bgr = cv2.resize(frame_bgr, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_LINEAR)
+        _, weights = self.hog.detectMultiScale(frame_bgr, winStride=(8, 8), padding=(8, 8), scale=1.05)
+        return len(weights) > 0 and float(np.max(weights)) >= self.min_confidence
+
+class ColourGate(Gate):
+    """Passes frames where at least `min_fraction` of pixels fall inside any of the HSV ranges."""
+    name = "colour"
+
+    # OpenCV hue runs 0-179; red wraps around, so it needs two ranges
+    presets: dict[str, list[tuple[tuple[int, int, int], tuple[int, int, int]]]] = {
+        "red": [((0, 100, 70), (10, 255, 255)), ((170, 100, 70), (179, 255, 255))],
+        "orange": [((11, 100, 70), (25, 255, 255))],
+        "yellow": [((26, 100, 70), (34, 255, 255))],
+        "green": [((35, 80, 50), (85, 255, 255))],
+        "blue": [((86, 100, 50), (130, 255, 255))],
+        "purple": [((131, 80, 50), (169, 255, 255))],
+        "white": [((0, 0, 200), (179, 30, 255))],
+        "black": [((0, 0, 0), (179, 255, 40))],
+        "skin": [((0, 30, 60), (20, 150, 255))],
+    }
+
+    def __init__(
+        self,
+        ranges: str | Sequence[tuple[tuple[int, int, int], tuple[int, int, int]]] = "red",
+        min_fraction: float = 0.01,
+        size: tuple[int, int] = (160, 90),
+    ):
+        if isinstance(ranges, str):
+            if ranges not in ColourGate.presets:
+                raise ValueError(f"Unknown colour preset: {ranges}")
+            ranges = ColourGate.presets[ranges]
+        self.ranges = [(np.array(lower, dtype=np.uint8), np.array(upper, dtype=np.uint8)) for lower, upper in ranges]
+        self.min_fraction = min_fraction
+        self.size = size
+
+    def check(self, frame_bgr: np.ndarray) -> bool:
+        hsv = cv2.cvtColor(cv2.resize(frame_bgr, self.size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2HSV)
+        mask = np.zeros(hsv.shape[:2], dtype=bool)
+        for lower, upper in self.ranges:
+            mask |= cv2.inRange(hsv, lower, upper) > 0
+        return float(mask.mean()) >= self.min_fraction
+
+class PrefilterCascade:
+    """
+    Runs gates in order on every frame, and the first one that rejects it decides the
+    outcome, so cheap gates should come first. Later gates are skipped unless they are
+    `stateful`, which keeps e.g. a motion gate comparing consecutive frames rather than
+    only the ones earlier gates let through. Keeps per-gate pass rates.
+    """
+
+    def __init__(self, gates: Sequence[Gate]):
+        self.gates = list(gates)
+        # Gates are reported by name; repeated gates get a numeric suffix
+        self.names = []
+        for gate in self.gates:
+            name = gate.name
+            while name in self.names:
+                name = f"{gate.name}_{len(self.names)}"
+            self.names.append(name)
+        self.evaluated = {name: 0 for name in self.names}
+        self.passed = {name: 0 for name in self.names}
+        self.total = 0
+        self.forwarded = 0
+        self.repeated = 0
+
+    def classify(self, frame: np.ndarray | EncodedFrame) -> Outcome:
+        """
+        "forward" to send the frame to the LLM, "reject" when it cannot match, or
+        "repeat" when it should reuse the verdict of the last frame sent through.
+        """
+        with metrics.stage("prefilter"):
+            if isinstance(frame, EncodedFrame):
+                frame = cv2.imdecode(np.frombuffer(frame.data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            self.total += 1
+            outcome: Outcome = "forward"
+            for name, gate in zip(self.names, self.gates):
+                if outcome != "forward" and not gate.stateful:
+                    continue
+                self.evaluated[name] += 1
+                if gate.check(frame):
+                    self.passed[name] += 1
+                elif outcome == "forward":
+                    outcome = gate.on_reject
+            if outcome == "forward":
+                self.forwarded += 1
+            elif outcome == "repeat":
+                self.repeated += 1
+            return outcome
+
+    def check(self, frame: np.ndarray | EncodedFrame) -> bool:
+        """True when the frame should be sent to the LLM."""
+        return self.classify(frame) == "forward"
+
+    def filter(self, frames: Sequence[np.ndarray | EncodedFrame]) -> list[bool]:
+        """One pass/reject verdict per frame, in order."""
+        return [self.check(frame) for frame in frames]
+
+    def stats(self) -> dict:
+        return {
+            "gates": {
+                name: {
+                    "evaluated": self.evaluated[name],
+                    "passed": self.passed[name],
+                    "pass_rate": round(self.passed[name] / self.evaluated[name], 3) if self.evaluated[name] else None,
+                }
+                for name in self.evaluated
+            },
+            "total": self.total,
+            "forwarded": self.forwarded,
+            "repeated": self.repeated,
+        }
+
+GATES: dict[str, Callable[..., Gate]] = {
+    "motion": lambda arg=None: MotionGate(float(arg)) if arg else MotionGate(),
+    "person": lambda arg=None: PersonGate(float(arg)) if arg else PersonGate(),
+    "colour": lambda arg=None: ColourGate(arg) if arg else ColourGate(),
+}
+
+def build_cascade(spec: str) -> PrefilterCascade:
+    """
+    Build a cascade from a comma-separated spec such as "motion,person" or
+    "motion:0.03,colour:red". Each gate takes one optional argument after a colon:
+    the motion threshold, the person confidence or the colour preset. Register custom
+    gates by adding a factory to `GATES`.
+    """
+    gates = []
+    for item in spec.split(","):
+        name, _, arg = item.strip().partition(":")
+        if not name:
+            continue
+        if name not in GATES:
+            raise ValueError(f"Unknown prefilter gate: {name} (known: {', '.join(GATES)})")
+        gates.append(GATES[name](arg.strip() or None))
+    return PrefilterCascade(gates)
@@ -0,0 +1,183 @@
+from contextlib import contextmanager
+import hashlib
+import json
+import os
+from pathlib import Path
+import pickle
+import tempfile
+import threading
+from typing import Any, BinaryIO, Collection, Iterator, Optional, Union
+
+CHUNK_SIZE = 1 << 20
+
+def hash_file(path: Union[str, Path]) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def _evict_oldest(root: Path, pattern: str, max_bytes: int, keep: Collection[str] = ()):
+    """
+    Delete the least recently used files matching `pattern` until they fit in
+    `max_bytes`, never deleting a file whose stem is in `keep`.
+    """
+    entries = []
+    for path in root.glob(pattern):
+        # Skip files that are still being written
+        if path.suffix == ".part":
+            continue
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        if not path.is_file():
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+        if total <= max_bytes:
+            break
+        if path.stem in keep:
+            continue
+        path.unlink(missing_ok=True)
+        total -= size
+
+class VideoStore:
+    """
+    Content-addressed store for uploaded videos. Uploads are hashed while they are
+    written, so the same video uploaded twice is stored once under its SHA-256.
+
+    Videos held through `upload` are never evicted while held. Holds are tracked per
+    process, so processes sharing one store should leave `max_bytes` unset or give
+    each its own root.
+    """
+
+    def __init__(self, root: Union[str, Path] = ".cache/videos", max_bytes: Optional[int] = None):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # video hash -> number of requests still reading it
+        self._in_use: dict[str, int] = {}
+        # resolved path -> (size, mtime_ns, hash) for videos outside the store
+        self._hashes: dict[str, tuple[int, int, str]] = {}
+
+    def save(self, stream: BinaryIO, filename: str = "", hold: bool = False) -> tuple[str, Path]:
+        """
+        Stream an upload into the store.
+
+        Args:
+            hold (bool): Mark the video in use before older videos are evicted; the
+                caller must `release` it once done. `upload` does both.
+
+        Returns:
+            tuple: (video_hash, path of the stored video).
+        """
+        suffix = Path(filename).suffix.lower()
+        sha = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                    sha.update(chunk)
+                    f.write(chunk)
+            video_hash = sha.hexdigest()
+            path = self.root / f"{video_hash}{suffix}"
+            with self._lock:
+                if path.exists():
+                    os.unlink(tmp_path)
+                    path.touch()
+                else:
+                    os.replace(tmp_path, path)
+                if hold:
+                    self._in_use[video_hash] = self._in_use.get(video_hash, 0) + 1
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+        if self.max_bytes is not None:
+            with self._lock:
+                _evict_oldest(self.root, "*", self.max_bytes, keep={video_hash, *self._in_use})
+        return video_hash, path
+
+    def release(self, video_hash: str):
+        """Let a video held by `save(hold=True)` be evicted again."""
+        with self._lock:
+            count = self._in_use.get(video_hash, 0) - 1
+            if count > 0:
+                self._in_use[video_hash] = count
+            else:
+                self._in_use.pop(video_hash, None)
+
+    @contextmanager
+    def upload(self, stream: BinaryIO, filename: str = "") -> Iterator[tuple[str, Path]]:
+        """Save an upload and keep it from being evicted until the block exits."""
+        video_hash, path = self.save(stream, filename, hold=True)
+        try:
+            yield video_hash, path
+        finally:
+            self.release(video_hash)
+
+    def hash_of(self, path: Union[str, Path]) -> str:
+        """
+        Hash of a video; free for stored videos, whose file name is their hash. Other
+        files are hashed once per (size, mtime), so repeat queries don't re-read them.
+        """
+        path = Path(path)
+        if path.parent.resolve() == self.root.resolve() and len(path.stem) == 64:
+            return path.stem
+        key = str(path.resolve())
+        stat = path.stat()
+        with self._lock:
+            cached = self._hashes.get(key)
+        if cached is not None and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+            return cached[2]
+        video_hash = hash_file(path)
+        with self._lock:
+            self._hashes[key] = (stat.st_size, stat.st_mtime_ns, video_hash)
+        return video_hash
+
+class FrameCache:
+    """
+    Disk cache of sampled, encoded frames keyed by (video hash, sampling parameters,
+    encoding parameters), so repeat queries on the same video skip decoding. Entries
+    are pickled to one file each and evicted least-recently-used beyond `max_bytes`.
+    """
+
+    def __init__(self, root: Union[str, Path] = ".cache/frames", max_bytes: int = 1 << 30):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(video_hash: str, sampling: dict, encoding: tuple) -> str:
+        key_parts = json.dumps([video_hash, sampling, list(encoding)], sort_keys=True)
+        return hashlib.sha256(key_parts.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        path = self.root / f"{key}.pkl"
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+            path.touch()
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any):
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".part")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.root / f"{key}.pkl")
+        _evict_oldest(self.root, "*.pkl", self.max_bytes, keep={key})
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
@@ -1,11 +1,35 @@
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+import math
+import multiprocessing
+from multiprocessing import shared_memory
+import os
+import threading
+import time
 import cv2
-from typing import List, Literal, Optional, Sequence
+import numpy as np
+from typing import TYPE_CHECKING, Iterator, List, Literal, Optional, Sequence
 from pathlib import Path
 from PIL import Image
 import io
 import base64
+from functools import cached_property
 from more_itertools import chunked
 
+import metrics
+
+# Optional decoder backend for PyAVVideoFrameSampler
+try:
+    import av
+except ImportError:
+    av = None
+
+if TYPE_CHECKING:
+    from store import FrameCache
+
+OutputFormat = Literal["PIL", "base64", "encoded"]
+
 def combine_frames_grid(frames: list[Image.Image], size: Optional[tuple[int, int]] = None) -> Image.Image:
     """
     Combines 4 PIL Image frames into a 2x2 grid.
@@ -21,79 +45,719 @@ def combine_frames_grid(frames: list[Image.Image], size: Optional[tuple[int, int
     if len(frames) != 4:
         raise ValueError(f"Exactly 4 frames are required to make a 2x2 grid. Received {len(frames)} frames")
 
-    if size:
-        frames = [frame.resize(size) for frame in frames]
+    grid = compose_grid([np.asarray(frame.convert("RGB")) for frame in frames], 2, 2, tile_size=size)
+    return Image.fromarray(grid)
 
-    w, h = frames[0].size
-    grid = Image.new("RGB", (2 * w, 2 * h))
+def compose_grid(
+    frames: Sequence[np.ndarray],
+    rows: int = 2,
+    cols: int = 2,
+    tile_size: Optional[tuple[int, int]] = None,
+    pad_value: int = 0,
+) -> np.ndarray:
+    """
+    Tiles up to rows * cols frames into one image, in reading order (left to right,
+    top to bottom). The output is allocated once and each frame is copied into its
+    slice; tiles without a frame are left filled with `pad_value`.
+
+    Args:
+        frames (list): HxWx3 uint8 arrays, any channel order as long as it's consistent.
+        rows (int): Number of tile rows.
+        cols (int): Number of tile columns.
+        tile_size (tuple): (width, height) of each tile. Defaults to the first frame's size.
+        pad_value (int): Fill value for empty tiles.
 
-    # Paste each image into the correct quadrant
-    grid.paste(frames[0], (0, 0))
-    grid.paste(frames[1], (w, 0))
-    grid.paste(frames[2], (0, h))
-    grid.paste(frames[3], (w, h))
+    Returns:
+        np.ndarray: The (rows * height, cols * width, 3) grid.
+    """
+    if not 0 < len(frames) <= rows * cols:
+        raise ValueError(f"Between 1 and {rows * cols} frames are required for a {rows}x{cols} grid. Received {len(frames)} frames")
 
+    if tile_size:
+        w, h = tile_size
+    else:
+        h, w = frames[0].shape[:2]
+    grid = np.full((rows * h, cols * w, 3), pad_value, dtype=np.uint8)
+    for i, frame in enumerate(frames):
+        if frame.shape[:2] != (h, w):
+            frame = cv2.resize(frame, (w, h), interpolation=cv2.INTER_AREA)
+        r, c = divmod(i, cols)
+        grid[r * h:(r + 1) * h, c * w:(c + 1) * w] = frame
     return grid
 
+def grid_shape_for(tiles: int) -> tuple[int, int]:
+    """The most square rows x cols layout with room for `tiles` frames, e.g. 4 -> (2, 2), 6 -> (2, 3)."""
+    rows = max(1, math.isqrt(tiles))
+    return rows, -(-tiles // rows)
+
+def frame_signature(frame_bgr: np.ndarray, size: tuple[int, int] = (64, 36)) -> tuple[np.ndarray, np.ndarray]:
+    """Downscaled grayscale thumbnail and normalized intensity histogram of a frame."""
+    small = cv2.resize(frame_bgr, size, interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    hist = cv2.calcHist([gray], [0], None, [32], [0, 256])
+    cv2.normalize(hist, hist)
+    return gray, hist
+
+def scene_change_score(
+    previous: tuple[np.ndarray, np.ndarray], 
+    current: tuple[np.ndarray, np.ndarray],
+) -> float:
+    """
+    How different two frame signatures are, from 0 (identical) to 1.
+    Takes the larger of the mean pixel difference and the histogram distance so that
+    both local motion and global lighting/cut changes register.
+    """
+    prev_gray, prev_hist = previous
+    cur_gray, cur_hist = current
+    pixel_diff = float(cv2.absdiff(prev_gray, cur_gray).mean()) / 255.0
+    hist_dist = float(cv2.compareHist(prev_hist, cur_hist, cv2.HISTCMP_BHATTACHARYYA))
+    return max(pixel_diff, hist_dist)
+
+def perceptual_hash(image: "Image.Image | np.ndarray | EncodedFrame") -> int:
+    """
+    64-bit DCT perceptual hash (pHash) of an image. Visually similar images have hashes
+    with a small Hamming distance. Accepts a PIL image, a BGR numpy frame or an
+    `EncodedFrame`.
+    """
+    if isinstance(image, EncodedFrame):
+        gray = cv2.imdecode(np.frombuffer(image.data, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_2)
+    elif isinstance(image, Image.Image):
+        gray = np.asarray(image.convert("L"))
+    elif image.ndim == 3:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    else:
+        gray = image
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low_freq = cv2.dct(small)[:8, :8].flatten()
+    # Compare against the median of the low frequencies, excluding the DC term
+    bits = low_freq > np.median(low_freq[1:])
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+def cluster_by_hash(hashes: Sequence[int], max_distance: int = 5) -> list[list[int]]:
+    """
+    Greedily group near-duplicate hashes. Each hash joins the first cluster whose
+    representative (its first member) is within `max_distance` bits, otherwise it starts
+    a new cluster.
+
+    Returns:
+        list: Clusters as lists of indices into `hashes`; the first index is the representative.
+    """
+    clusters: list[list[int]] = []
+    for i, h in enumerate(hashes):
+        for cluster in clusters:
+            if hamming_distance(hashes[cluster[0]], h) <= max_distance:
+                cluster.append(i)
+                break
+        else:
+            clusters.append([i])
+    return clusters
+
+class EncodedFrame:
+    """A compressed image, with its base64 form computed once on first use."""
+
+    def __init__(self, data: bytes, mime_type: str, width: int, height: int):
+        self.data = data
+        self.mime_type = mime_type
+        self.width = width
+        self.height = height
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __getstate__(self):
+        # Don't pickle the cached base64 copies; they are cheap to rebuild
+        return {"data": self.data, "mime_type": self.mime_type, "width": self.width, "height": self.height}
+
+    @cached_property
+    def base64(self) -> str:
+        with metrics.stage("base64"):
+            return base64.b64encode(self.data).decode("utf-8")
+
+    @cached_property
+    def data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{self.base64}"
+
+    def drop_cached(self):
+        """Free the base64 copies, e.g. once the data URL has been handed to a request."""
+        self.__dict__.pop("base64", None)
+        self.__dict__.pop("data_url", None)
+
+class FrameEncoder:
+    """
+    Encodes BGR frames straight from numpy with `cv2.imencode`.
+
+    Frames larger than `max_side` are downscaled first. If `max_bytes` is set and the
+    result is still too large, quality is lowered step by step down to `min_quality`,
+    then the frame is shrunk further until it fits.
+    """
+    codecs: dict[str, tuple[str, str, int]] = {
+        "jpeg": (".jpg", "image/jpeg", cv2.IMWRITE_JPEG_QUALITY),
+        "webp": (".webp", "image/webp", cv2.IMWRITE_WEBP_QUALITY),
+        "png": (".png", "image/png", cv2.IMWRITE_PNG_COMPRESSION),
+    }
+
+    def __init__(
+        self,
+        max_side: Optional[int] = None,
+        codec: Literal["jpeg", "webp", "png"] = "jpeg",
+        quality: int = 75,
+        max_bytes: Optional[int] = None,
+        min_quality: int = 40,
+    ):
+        if codec not in FrameEncoder.codecs:
+            raise ValueError(f"Unsupported codec: {codec}")
+        self.max_side = max_side
+        self.codec = codec
+        self.quality = quality
+        self.max_bytes = max_bytes
+        self.min_quality = min_quality
+
+    def params(self) -> tuple:
+        """Hashable description of the encoding settings."""
+        return (self.codec, self.max_side, self.quality, self.max_bytes, self.min_quality)
+
+    def _imencode(self, frame_bgr: np.ndarray, quality: int) -> bytes:
+        ext, _, flag = FrameEncoder.codecs[self.codec]
+        # PNG takes a 0-9 compression level instead of a quality
+        value = 3 if self.codec == "png" else quality
+        ok, buffer = cv2.imencode(ext, frame_bgr, [flag, value])
+        if not ok:
+            raise ValueError(f"Failed to encode frame as {self.codec}")
+        return buffer.tobytes()
+
+    @staticmethod
+    def _resize(frame_bgr: np.ndarray, max_side: int) -> np.ndarray:
+        h, w = frame_bgr.shape[:2]
+        scale = max_side / max(h, w)
+        if scale >= 1:
+            return frame_bgr
+        return cv2.resize(frame_bgr, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+
+    def encode(self, frame: np.ndarray | Image.Image) -> EncodedFrame:
+        with metrics.stage("encode"):
+            return self._encode(frame)
+
+    def _encode(self, frame: np.ndarray | Image.Image) -> EncodedFrame:
+        if isinstance(frame, Image.Image):
+            with metrics.stage("colour_convert"):
+                frame = cv2.cvtColor(np.asarray(frame.convert("RGB")), cv2.COLOR_RGB2BGR)
+        if self.max_side:
+            frame = self._resize(frame, self.max_side)
+
+        quality = self.quality
+        data = self._imencode(frame, quality)
+        if self.max_bytes is not None:
+            while len(data) > self.max_bytes and self.codec != "png" and quality > self.min_quality:
+                quality = max(self.min_quality, quality - 10)
+                data = self._imencode(frame, quality)
+            while len(data) > self.max_bytes and max(frame.shape[:2]) > 64:
+                frame = self._resize(frame, int(max(frame.shape[:2]) * 0.75))
+                data = self._imencode(frame, quality)
+
+        h, w = frame.shape[:2]
+        return EncodedFrame(data, FrameEncoder.codecs[self.codec][1], w, h)
+
 class VideoFrameSampler:
-    def __init__(self, video_path: str | Path):
+    # Keyframe interval assumed when choosing between seeking and linear decoding.
+    # x264/x265 default to 250; intra-only codecs can seek to any frame for free.
+    default_gop_size: int = 250
+    intra_only_fourccs: set[str] = {"MJPG", "mjpa", "mjpb", "jpeg", "png ", "rawv"}
+
+    def __init__(
+        self, 
+        video_path: str | Path, 
+        gop_size: Optional[int] = None, 
+        encoder: Optional[FrameEncoder] = None,
+        frame_cache: Optional["FrameCache"] = None,
+        video_hash: Optional[str] = None,
+    ):
         self.video_path = str(video_path)
-        self.cap = cv2.VideoCapture(self.video_path)
+        self.encoder = encoder if encoder else FrameEncoder()
+        # Encoded grids are looked up in / saved to `frame_cache` when the video's content hash is known
+        self.frame_cache = frame_cache
+        self.video_hash = video_hash
+        with metrics.stage("open"):
+            self.cap = self._open()
         if not self.cap.isOpened():
             raise IOError(f"Cannot open video file: {self.video_path}")
         self.fps = self.cap.get(cv2.CAP_PROP_FPS)
         self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    
-    def sample_multiframe_grid(
-        self, 
-        sampled_frames,
-    ):
-        # Step 2: Chunk frames into groups of 4
-        grouped_outputs = []
-        for group in chunked(sampled_frames, 4):
-            if len(group) == 4:
-                grid = combine_frames_grid(group)
-            else:
-                grid = group[0]  # Use single image if < 4 remain
+        self.gop_size = gop_size if gop_size else self._guess_gop_size()
 
-            grouped_outputs.append(grid)
-        return grouped_outputs
+    def _guess_gop_size(self) -> int:
+        fourcc = int(self.cap.get(cv2.CAP_PROP_FOURCC))
+        codec = "".join(chr((fourcc >> (8 * i)) & 0xFF) for i in range(4))
+        return 1 if codec in VideoFrameSampler.intra_only_fourccs else VideoFrameSampler.default_gop_size
 
-    def sample_frames(
+    def _open(self) -> cv2.VideoCapture:
+        return cv2.VideoCapture(self.video_path)
+
+    def _capture(self) -> cv2.VideoCapture:
+        """Return the open capture, reopening it if a previous pass released it."""
+        if not self.cap.isOpened():
+            self.cap = self._open()
+            if not self.cap.isOpened():
+                raise IOError(f"Cannot open video file: {self.video_path}")
+        return self.cap
+
+    def _convert(self, frame_bgr: np.ndarray, output_format: OutputFormat) -> Image.Image | str | EncodedFrame:
+        if output_format == "PIL":
+            with metrics.stage("colour_convert"):
+                return self._cv2_to_pil(frame_bgr)
+        encoded = self.encoder.encode(frame_bgr)
+        return encoded if output_format == "encoded" else encoded.base64
+
+    def choose_decode_mode(self, interval: int) -> Literal["seek", "sequential"]:
+        """
+        Seeking decodes forward from the previous keyframe for every sample, so it only
+        pays off when samples are further apart than a GOP. Otherwise grabbing every
+        frame in one linear pass is cheaper.
+        """
+        return "sequential" if interval <= self.gop_size else "seek"
+
+    def _iter_raw_frames(
         self,
         every_n_seconds: float = 1.0,
-        output_format: Literal["PIL", "base64"] = "PIL",
         max_frames: int | None = None,
-        multiframe: bool = False,
-    ) -> Sequence[Image.Image | str]:
-        interval = int(self.fps * every_n_seconds)
-        frames = []
+        decode_mode: Literal["auto", "seek", "sequential"] = "auto",
+    ) -> Iterator[tuple[int, np.ndarray]]:
+        """Yield (frame_idx, BGR frame) for every sampled index."""
+        interval = max(1, int(self.fps * every_n_seconds))
+        if decode_mode == "auto":
+            decode_mode = self.choose_decode_mode(interval)
+        if decode_mode not in ("seek", "sequential"):
+            raise ValueError(f"Unsupported decode mode: {decode_mode}")
+
+        cap = self._capture()
         count = 0
+        try:
+            if decode_mode == "seek":
+                for frame_idx in range(0, self.total_frames, interval):
+                    if max_frames is not None and count >= max_frames:
+                        break
+                    start = time.perf_counter()
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    metrics.record("decode", time.perf_counter() - start)
+                    yield frame_idx, frame
+                    count += 1
+            else:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                frame_idx = 0
+                # Each sampled frame is charged for the skipped frames grabbed before it
+                start = time.perf_counter()
+                while max_frames is None or count < max_frames:
+                    # grab() demuxes and decodes; only sampled frames pay for retrieve()
+                    if not cap.grab():
+                        break
+                    if frame_idx % interval == 0:
+                        ret, frame = cap.retrieve()
+                        if not ret:
+                            break
+                        metrics.record("decode", time.perf_counter() - start)
+                        yield frame_idx, frame
+                        start = time.perf_counter()
+                        count += 1
+                    frame_idx += 1
+        finally:
+            cap.release()
 
-        for frame_idx in range(0, self.total_frames, interval):
-            if max_frames is not None and count >= max_frames:
-                break
+    @property
+    def duration(self) -> float:
+        return self.total_frames / self.fps if self.fps else 0.0
 
-            self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
-            ret, frame = self.cap.read()
+    def decoder_params(self) -> dict:
+        """Decoder settings that change the decoded frames, for cache keys. Empty for plain OpenCV decoding."""
+        return {}
+
+    def frames_at(
+        self,
+        timestamps: Sequence[float],
+        output_format: OutputFormat = "PIL",
+    ) -> list[Image.Image | str | EncodedFrame]:
+        """
+        Random access: decode the frames closest to the given timestamps (in seconds).
+        Frames are returned in the same order as `timestamps`. The capture is left open
+        so repeated lookups don't pay for reopening the file.
+        """
+        if output_format not in ("PIL", "base64", "encoded"):
+            raise ValueError(f"Unsupported format: {output_format}")
+
+        cap = self._capture()
+        last_idx = max(0, self.total_frames - 1)
+        decoded: dict[int, Image.Image | str | EncodedFrame] = {}
+        # Seek in ascending order so the decoder mostly moves forward
+        for frame_idx in sorted({min(last_idx, max(0, round(t * self.fps))) for t in timestamps}):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+            ret, frame = cap.read()
             if not ret:
+                raise IOError(f"Cannot read frame {frame_idx} of {self.video_path}")
+            decoded[frame_idx] = self._convert(frame, output_format)
+
+        return [decoded[min(last_idx, max(0, round(t * self.fps)))] for t in timestamps]
+
+    def _iter_adaptive_frames(
+        self,
+        every_n_seconds: float = 1.0,
+        max_frames: int | None = None,
+        decode_mode: Literal["auto", "seek", "sequential"] = "auto",
+        scene_threshold: float = 0.05,
+        max_gap_seconds: float = 10.0,
+    ) -> Iterator[tuple[int, np.ndarray]]:
+        """
+        Probe the video every `every_n_seconds` but only yield frames that differ enough
+        from the last emitted one, or when `max_gap_seconds` passed without an emission.
+        """
+        last_signature = None
+        last_emitted_sec = 0.0
+        count = 0
+        for frame_idx, frame in self._iter_raw_frames(every_n_seconds, None, decode_mode):
+            if max_frames is not None and count >= max_frames:
                 break
-            image = self._cv2_to_pil(frame)
-            frames.append(image)
-            count += 1
-        
-        if multiframe:
-            frames = self.sample_multiframe_grid(frames)
+            signature = frame_signature(frame)
+            timestamp_sec = frame_idx / self.fps
+            if (
+                last_signature is None
+                or scene_change_score(last_signature, signature) >= scene_threshold
+                or timestamp_sec - last_emitted_sec >= max_gap_seconds
+            ):
+                last_signature = signature
+                last_emitted_sec = timestamp_sec
+                yield frame_idx, frame
+                count += 1
 
-        if output_format == "PIL":
-            pass
-        elif output_format == "base64":
-            frames = [self._pil_to_base64(image) for image in frames]
-        else:
+    def iter_frames(
+        self,
+        every_n_seconds: float = 1.0,
+        output_format: OutputFormat = "PIL",
+        max_frames: int | None = None,
+        decode_mode: Literal["auto", "seek", "sequential"] = "auto",
+        sampling: Literal["fixed", "adaptive"] = "fixed",
+        scene_threshold: float = 0.05,
+        max_gap_seconds: float = 10.0,
+    ) -> Iterator[tuple[float, Image.Image | str | EncodedFrame]]:
+        """
+        Lazily sample the video, yielding (timestamp_sec, frame) as each frame is decoded.
+
+        Args:
+            every_n_seconds (float): Sampling interval.
+            output_format (str): "PIL", "base64", or "encoded" for `EncodedFrame` objects.
+                The last two go through `self.encoder` without a PIL round-trip.
+            max_frames (int): Stop after this many frames (optional).
+            decode_mode (str): "seek" to jump to each sample, "sequential" to read the
+                video linearly, or "auto" to pick from the interval and GOP size.
+            sampling (str): "fixed" emits every sampled frame. "adaptive" treats
+                `every_n_seconds` as the probe interval and only emits a frame when the
+                scene changed by at least `scene_threshold` (0-1), or when
+                `max_gap_seconds` passed since the last emitted frame.
+        """
+        if output_format not in ("PIL", "base64", "encoded"):
+            raise ValueError(f"Unsupported format: {output_format}")
+
+        raw_frames = self._iter_sampled_frames(
+            every_n_seconds, max_frames, decode_mode, sampling, scene_threshold, max_gap_seconds
+        )
+        for frame_idx, frame in raw_frames:
+            yield round(frame_idx / self.fps, 5), self._convert(frame, output_format)
+
+    def _iter_sampled_frames(
+        self,
+        every_n_seconds: float,
+        max_frames: int | None,
+        decode_mode: Literal["auto", "seek", "sequential"],
+        sampling: Literal["fixed", "adaptive"],
+        scene_threshold: float,
+        max_gap_seconds: float,
+    ) -> Iterator[tuple[int, np.ndarray]]:
+        if sampling == "fixed":
+            return self._iter_raw_frames(every_n_seconds, max_frames, decode_mode)
+        elif sampling == "adaptive":
+            return self._iter_adaptive_frames(
+                every_n_seconds, max_frames, decode_mode, scene_threshold, max_gap_seconds
+            )
+        raise ValueError(f"Unsupported sampling mode: {sampling}")
+
+    def iter_grids(
+        self,
+        every_n_seconds: float = 1.0,
+        grid_shape: tuple[int, int] = (2, 2),
+        output_format: OutputFormat = "PIL",
+        max_frames: int | None = None,
+        tile_size: Optional[tuple[int, int]] = None,
+        decode_mode: Literal["auto", "seek", "sequential"] = "auto",
+        sampling: Literal["fixed", "adaptive"] = "fixed",
+        scene_threshold: float = 0.05,
+        max_gap_seconds: float = 10.0,
+    ) -> Iterator[tuple[list[float], Image.Image | str | EncodedFrame]]:
+        """
+        Pack consecutive sampled frames into rows x cols grids, built directly from the
+        decoded arrays. Yields (tile_timestamps, grid) where `tile_timestamps[i]` is the
+        timestamp of the tile at row i // cols, column i % cols. The last grid may hold
+        fewer frames than tiles; its empty tiles are black and have no timestamp.
+        `max_frames` counts individual frames, not grids.
+        """
+        if output_format not in ("PIL", "base64", "encoded"):
             raise ValueError(f"Unsupported format: {output_format}")
 
-        self.cap.release()
+        groups = self.iter_frame_groups(
+            every_n_seconds, grid_shape, max_frames, decode_mode, sampling, scene_threshold, max_gap_seconds
+        )
+        for group in groups:
+            grid = self.compose_group(group, grid_shape, tile_size, downscale=output_format != "PIL")
+            yield [round(frame_idx / self.fps, 5) for frame_idx, _ in group], self._convert(grid, output_format)
+
+    def iter_frame_groups(
+        self,
+        every_n_seconds: float = 1.0,
+        grid_shape: tuple[int, int] = (2, 2),
+        max_frames: int | None = None,
+        decode_mode: Literal["auto", "seek", "sequential"] = "auto",
+        sampling: Literal["fixed", "adaptive"] = "fixed",
+        scene_threshold: float = 0.05,
+        max_gap_seconds: float = 10.0,
+    ) -> Iterator[list[tuple[int, np.ndarray]]]:
+        """The decoding half of `iter_grids`: lists of (frame_idx, BGR frame), one per grid."""
+        rows, cols = grid_shape
+        raw_frames = self._iter_sampled_frames(
+            every_n_seconds, max_frames, decode_mode, sampling, scene_threshold, max_gap_seconds
+        )
+        return chunked(raw_frames, rows * cols)
+
+    def compose_group(
+        self,
+        group: Sequence[tuple[int, np.ndarray]],
+        grid_shape: tuple[int, int] = (2, 2),
+        tile_size: Optional[tuple[int, int]] = None,
+        downscale: bool = True,
+    ) -> np.ndarray:
+        """The composing half of `iter_grids`: one BGR grid from a group of decoded frames."""
+        rows, cols = grid_shape
+        if tile_size is None and downscale and self.encoder.max_side:
+            # Shrink tiles up front instead of composing a full-resolution grid the encoder would downscale anyway
+            h, w = group[0][1].shape[:2]
+            scale = min(1.0, self.encoder.max_side / max(cols * w, rows * h))
+            tile_size = (max(1, round(w * scale)), max(1, round(h * scale)))
+        with metrics.stage("grid"):
+            return compose_grid([frame for _, frame in group], rows, cols, tile_size)
+
+    def iter_frame_windows(
+        self,
+        every_n_seconds: float = 1.0,
+        window_size: int = 4,
+        stride: int = 2,
+        max_frames: int | None = None,
+        decode_mode: Literal["auto", "seek", "sequential"] = "auto",
+        sampling: Literal["fixed", "adaptive"] = "fixed",
+        scene_threshold: float = 0.05,
+        max_gap_seconds: float = 10.0,
+    ) -> Iterator[list[tuple[int, np.ndarray]]]:
+        """
+        Sliding windows of `window_size` consecutive sampled frames, one starting every
+        `stride` frames. Decoded frames are kept in a ring buffer, so frames shared by
+        overlapping windows are decoded once. When the stride would leave the last
+        frames out, a final window ending on the last frame is added; a video shorter
+        than one window gives a single short window.
+        """
+        if window_size < 1 or stride < 1:
+            raise ValueError("window_size and stride must be at least 1")
+        ring: deque[tuple[int, np.ndarray]] = deque(maxlen=window_size)
+        # Frames pushed into the ring since the last window was emitted
+        pending = 0
+        emitted = False
+        raw_frames = self._iter_sampled_frames(
+            every_n_seconds, max_frames, decode_mode, sampling, scene_threshold, max_gap_seconds
+        )
+        for item in raw_frames:
+            ring.append(item)
+            pending += 1
+            if len(ring) == window_size and (not emitted or pending >= stride):
+                yield list(ring)
+                pending = 0
+                emitted = True
+        if ring and (not emitted or pending > 0):
+            yield list(ring)
+
+    def planned_windows(self, every_n_seconds: float = 1.0, window_size: int = 4, stride: int = 2, max_frames: int | None = None) -> int:
+        """Windows `iter_frame_windows` will yield with fixed-rate sampling."""
+        samples = self.planned_samples(every_n_seconds, max_frames)
+        if samples <= window_size:
+            return 1 if samples else 0
+        return 1 + -(-(samples - window_size) // stride)
+
+    def planned_samples(self, every_n_seconds: float = 1.0, max_frames: int | None = None) -> int:
+        """Frames fixed-rate sampling will decode; an upper bound for adaptive sampling."""
+        interval = max(1, int(self.fps * every_n_seconds))
+        samples = -(-self.total_frames // interval)
+        return samples if max_frames is None else min(samples, max_frames)
+
+    def grid_cache_key(
+        self,
+        every_n_seconds: float = 1.0,
+        grid_shape: tuple[int, int] = (2, 2),
+        max_frames: int | None = None,
+        tile_size: Optional[tuple[int, int]] = None,
+        sampling: Literal["fixed", "adaptive"] = "fixed",
+        scene_threshold: float = 0.05,
+        max_gap_seconds: float = 10.0,
+        window: Optional[tuple[int, int]] = None,
+    ) -> Optional[str]:
+        """
+        `self.frame_cache` key for encoded grids sampled with these settings, or None
+        without a cache. `window` is (window_size, stride) for sliding windows.
+        """
+        if self.frame_cache is None or not self.video_hash:
+            return None
+        sampling_params = {
+            "every_n_seconds": every_n_seconds,
+            "grid_shape": list(grid_shape),
+            "max_frames": max_frames,
+            "tile_size": list(tile_size) if tile_size else None,
+            "sampling": sampling,
+            "scene_threshold": scene_threshold if sampling == "adaptive" else None,
+            "max_gap_seconds": max_gap_seconds if sampling == "adaptive" else None,
+        }
+        # Only added when set, so keys for back-to-back grids and OpenCV decoding stay the same
+        if window:
+            sampling_params["window"] = list(window)
+        decoder = self.decoder_params()
+        if decoder:
+            sampling_params["decoder"] = decoder
+        return self.frame_cache.make_key(self.video_hash, sampling_params, self.encoder.params())
+
+    def sample_multiframe_grid(
+        self, 
+        sampled_frames: Sequence[Image.Image],
+        grid_shape: tuple[int, int] = (2, 2),
+    ) -> list[Image.Image]:
+        """Chunk already sampled PIL frames into grids, padding the last partial grid."""
+        rows, cols = grid_shape
+        return [
+            Image.fromarray(compose_grid([np.asarray(frame.convert("RGB")) for frame in group], rows, cols))
+            for group in chunked(sampled_frames, rows * cols)
+        ]
+
+    def sample_grids(
+        self,
+        every_n_seconds: float = 1.0,
+        grid_shape: tuple[int, int] = (2, 2),
+        output_format: OutputFormat = "PIL",
+        max_frames: int | None = None,
+        tile_size: Optional[tuple[int, int]] = None,
+        decode_mode: Literal["auto", "seek", "sequential"] = "auto",
+        sampling: Literal["fixed", "adaptive"] = "fixed",
+        scene_threshold: float = 0.05,
+        max_gap_seconds: float = 10.0,
+    ) -> tuple[list[list[float]], list[Image.Image | str | EncodedFrame]]:
+        """
+        List form of `iter_grids`: (per-grid tile timestamps, grids). Encoded results are
+        served from and saved to `self.frame_cache` when one is configured.
+        """
+        cache_key = None
+        if output_format != "PIL":
+            cache_key = self.grid_cache_key(
+                every_n_seconds, grid_shape, max_frames, tile_size, sampling, scene_threshold, max_gap_seconds
+            )
+        if cache_key:
+            cached = self.frame_cache.get(cache_key)
+            if cached is not None:
+                tile_timestamps, grids = cached
+                return tile_timestamps, [grid if output_format == "encoded" else grid.base64 for grid in grids]
+
+        tile_timestamps = []
+        grids = []
+        for timestamps, grid in self.iter_grids(
+            every_n_seconds=every_n_seconds,
+            grid_shape=grid_shape,
+            output_format="encoded" if cache_key else output_format,
+            max_frames=max_frames,
+            tile_size=tile_size,
+            decode_mode=decode_mode,
+            sampling=sampling,
+            scene_threshold=scene_threshold,
+            max_gap_seconds=max_gap_seconds,
+        ):
+            tile_timestamps.append(timestamps)
+            grids.append(grid)
 
+        if cache_key:
+            self.frame_cache.set(cache_key, (tile_timestamps, grids))
+            if output_format == "base64":
+                grids = [grid.base64 for grid in grids]
+        return tile_timestamps, grids
+
+    def sample_frames_with_timestamps(
+        self,
+        every_n_seconds: float = 1.0,
+        output_format: OutputFormat = "PIL",
+        max_frames: int | None = None,
+        multiframe: bool = False,
+        decode_mode: Literal["auto", "seek", "sequential"] = "auto",
+        sampling: Literal["fixed", "adaptive"] = "fixed",
+        scene_threshold: float = 0.05,
+        max_gap_seconds: float = 10.0,
+        grid_shape: tuple[int, int] = (2, 2),
+    ) -> tuple[list[float], Sequence[Image.Image | str | EncodedFrame]]:
+        """
+        Same as `sample_frames`, but also returns the timestamp (in seconds) of every
+        output image. For multiframe grids this is the timestamp of the first tile; use
+        `sample_grids` for the timestamp of every tile.
+        """
+        if multiframe:
+            tile_timestamps, frames = self.sample_grids(
+                every_n_seconds=every_n_seconds,
+                grid_shape=grid_shape,
+                output_format=output_format,
+                max_frames=max_frames,
+                decode_mode=decode_mode,
+                sampling=sampling,
+                scene_threshold=scene_threshold,
+                max_gap_seconds=max_gap_seconds,
+            )
+            return [timestamps[0] for timestamps in tile_timestamps], frames
+
+        timestamps = []
+        frames = []
+        for timestamp_sec, image in self.iter_frames(
+            every_n_seconds=every_n_seconds,
+            output_format=output_format,
+            max_frames=max_frames,
+            decode_mode=decode_mode,
+            sampling=sampling,
+            scene_threshold=scene_threshold,
+            max_gap_seconds=max_gap_seconds,
+        ):
+            timestamps.append(timestamp_sec)
+            frames.append(image)
+        return timestamps, frames
+
+    def sample_frames(
+        self,
+        every_n_seconds: float = 1.0,
+        output_format: OutputFormat = "PIL",
+        max_frames: int | None = None,
+        multiframe: bool = False,
+        decode_mode: Literal["auto", "seek", "sequential"] = "auto",
+        sampling: Literal["fixed", "adaptive"] = "fixed",
+        scene_threshold: float = 0.05,
+        max_gap_seconds: float = 10.0,
+        grid_shape: tuple[int, int] = (2, 2),
+    ) -> Sequence[Image.Image | str | EncodedFrame]:
+        _, frames = self.sample_frames_with_timestamps(
+            every_n_seconds=every_n_seconds,
+            output_format=output_format,
+            max_frames=max_frames,
+            multiframe=multiframe,
+            decode_mode=decode_mode,
+            sampling=sampling,
+            scene_threshold=scene_threshold,
+            max_gap_seconds=max_gap_seconds,
+            grid_shape=grid_shape,
+        )
         return frames
 
     @staticmethod
@@ -105,4 +769,549 @@ class VideoFrameSampler:
     def _pil_to_base64(image: Image.Image) -> str:
         buffer = io.BytesIO()
         image.save(buffer, format="JPEG")
-        return base64.b64encode(buffer.getvalue()).decode("utf-8")
\ No newline at end of file
+        return base64.b64encode(buffer.getvalue()).decode("utf-8")
+class FrameShapeError(ValueError):
+    """A decoded frame's size differs from the one the shared memory slots were sized for."""
+
+def _decode_range_to_shared_memory(
+    video_path: str,
+    frame_indices: list[int],
+    decode_mode: Literal["seek", "sequential"],
+    shm_name: str,
+    frame_shape: tuple[int, int, int],
+    max_side: Optional[int] = None,
+) -> int:
+    """
+    Worker for `ParallelVideoFrameSampler`: decode `frame_indices` (ascending) with a
+    private capture, downscale them to fit `max_side` and write them into consecutive
+    slots of the shared memory block. Returns how many frames were written, which is
+    less than requested at end of stream. Raises `FrameShapeError` if the video's frame
+    size changes mid-stream.
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    cap = cv2.VideoCapture(video_path)
+    count = 0
+
+    def store(frame_idx: int, frame: np.ndarray):
+        if max_side:
+            frame = FrameEncoder._resize(frame, max_side)
+        if frame.shape != frame_shape:
+            raise FrameShapeError(f"Frame {frame_idx} of {video_path} is {frame.shape}, expected {frame_shape}")
+        out[count] = frame
+
+    try:
+        if not cap.isOpened():
+            raise IOError(f"Cannot open video file: {video_path}")
+        out = np.ndarray((len(frame_indices), *frame_shape), dtype=np.uint8, buffer=shm.buf)
+        if decode_mode == "seek":
+            for frame_idx in frame_indices:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                store(frame_idx, frame)
+                count += 1
+        else:
+            # One seek to the start of the range, then a linear pass through it
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_indices[0])
+            frame_idx = frame_indices[0]
+            while count < len(frame_indices) and cap.grab():
+                if frame_idx == frame_indices[count]:
+                    ret, frame = cap.retrieve()
+                    if not ret:
+                        break
+                    store(frame_idx, frame)
+                    count += 1
+                frame_idx += 1
+        del out
+        return count
+    finally:
+        cap.release()
+        shm.close()
+
+_decode_pools: dict[tuple[int, int], ProcessPoolExecutor] = {}
+_decode_pools_lock = threading.Lock()
+
+def get_decode_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Return this process's decode pool with `workers` processes, creating it on first
+    use. Spawning workers costs an interpreter start and an import of the server each,
+    so the pool lives for the whole process instead of one per sampling pass.
+    """
+    key = (os.getpid(), workers)
+    with _decode_pools_lock:
+        executor = _decode_pools.get(key)
+        if executor is None:
+            # Spawned workers don't inherit the parent's threads or open captures
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _decode_pools[key] = executor
+        return executor
+
+def _discard_decode_pool(executor: ProcessPoolExecutor):
+    """Drop a broken pool (a worker died) so the next pass starts a fresh one."""
+    with _decode_pools_lock:
+        for key, pool in list(_decode_pools.items()):
+            if pool is executor:
+                del _decode_pools[key]
+    executor.shutdown(wait=False, cancel_futures=True)
+
+class ParallelVideoFrameSampler(VideoFrameSampler):
+    """
+    `VideoFrameSampler` that decodes with a pool of worker processes, for long videos
+    where single-core decoding dominates.
+
+    The sampled frame indices are split into contiguous ranges of up to
+    `frames_per_task` frames. Each range is decoded by a worker with its own capture,
+    downscaled to fit `max_side` and written straight into a shared memory block, and
+    frames are yielded back in timestamp order. Ranges are only submitted while the
+    blocks in flight total at most `max_shm_bytes` (at least one range is always in
+    flight), so /dev/shm use is bounded whatever the video's resolution or length.
+    Everything built on the raw frame stream (adaptive sampling, grids, encoding,
+    `sample_frames`) works unchanged. The worker processes come from
+    `get_decode_pool` and are reused by every sampler with the same worker count.
+
+    If the frame size changes mid-video, the rest of it is decoded on one core by the
+    base class instead.
+
+    Args:
+        max_side (int): Longest side of decoded frames; None keeps the source size.
+            Anything above the encoder's `max_side` is downscaled before sending anyway.
+        max_shm_bytes (int): Shared memory budget for frames in flight. Docker gives
+            containers 64 MB of /dev/shm by default.
+    """
+
+    def __init__(
+        self, 
+        video_path: str | Path, 
+        workers: Optional[int] = None,
+        frames_per_task: int = 32,
+        max_side: Optional[int] = None,
+        max_shm_bytes: int = 48 << 20,
+        gop_size: Optional[int] = None, 
+        encoder: Optional[FrameEncoder] = None,
+        frame_cache: Optional["FrameCache"] = None,
+        video_hash: Optional[str] = None,
+    ):
+        super().__init__(video_path, gop_size, encoder, frame_cache, video_hash)
+        self.workers = workers if workers else (os.cpu_count() or 1)
+        self.frames_per_task = frames_per_task
+        self.max_side = max_side
+        self.max_shm_bytes = max_shm_bytes
+
+    def decoder_params(self) -> dict:
+        return {"max_side": self.max_side} if self.max_side else {}
+
+    def _fit(self, frame: np.ndarray) -> np.ndarray:
+        return FrameEncoder._resize(frame, self.max_side) if self.max_side else frame
+
+    def _decoded_shape(self) -> Optional[tuple[int, int, int]]:
+        """Shape of the first frame as the workers will store it, after rotation and downscaling."""
+        cap = self._capture()
+        try:
+            ret, frame = cap.read()
+        finally:
+            cap.release()
+        return self._fit(frame).shape if ret else None
+
+    def _iter_raw_frames(
+        self,
+        every_n_seconds: float = 1.0,
+        max_frames: int | None = None,
+        decode_mode: Literal["auto", "seek", "sequential"] = "auto",
+    ) -> Iterator[tuple[int, np.ndarray]]:
+        if self.workers <= 1:
+            for frame_idx, frame in super()._iter_raw_frames(every_n_seconds, max_frames, decode_mode):
+                yield frame_idx, self._fit(frame)
+            return
+
+        interval = max(1, int(self.fps * every_n_seconds))
+        if decode_mode == "auto":
+            decode_mode = self.choose_decode_mode(interval)
+        if decode_mode not in ("seek", "sequential"):
+            raise ValueError(f"Unsupported decode mode: {decode_mode}")
+
+        frame_shape = self._decoded_shape()
+        if frame_shape is None:
+            return
+        frame_bytes = int(np.prod(frame_shape))
+        # Small enough ranges that every worker can have one in flight within the budget
+        frames_per_task = max(1, min(self.frames_per_task, self.max_shm_bytes // (frame_bytes * self.workers)))
+        frame_indices = list(range(0, self.total_frames, interval))[:max_frames]
+        tasks = iter(chunked(frame_indices, frames_per_task))
+        executor = get_decode_pool(self.workers)
+        pending: deque[tuple[list[int], shared_memory.SharedMemory, Future]] = deque()
+        in_flight_bytes = 0
+        # First frame index left for the single-core fallback, if the frame size changed
+        fallback_from: Optional[int] = None
+
+        def submit_next() -> bool:
+            nonlocal in_flight_bytes
+            if len(pending) >= 2 * self.workers:
+                return False
+            if pending and in_flight_bytes + frames_per_task * frame_bytes > self.max_shm_bytes:
+                return False
+            indices = next(tasks, None)
+            if indices is None:
+                return False
+            shm = shared_memory.SharedMemory(create=True, size=len(indices) * frame_bytes)
+            in_flight_bytes += len(indices) * frame_bytes
+            try:
+                future = executor.submit(
+                    _decode_range_to_shared_memory,
+                    self.video_path, indices, decode_mode, shm.name, frame_shape, self.max_side,
+                )
+            except BrokenProcessPool:
+                in_flight_bytes -= len(indices) * frame_bytes
+                shm.close()
+                shm.unlink()
+                _discard_decode_pool(executor)
+                raise
+            pending.append((indices, shm, future))
+            return True
+
+        try:
+            while submit_next():
+                pass
+            while pending:
+                indices, shm, future = pending.popleft()
+                try:
+                    # Workers decode in other processes; what this process sees is the wait per range
+                    with metrics.stage("decode"):
+                        count = future.result()
+                    frames = np.ndarray((len(indices), *frame_shape), dtype=np.uint8, buffer=shm.buf)
+                    # Copy out so the block can be released before the consumer is done with the frame
+                    decoded = [(frame_idx, frames[i].copy()) for i, frame_idx in enumerate(indices[:count])]
+                    del frames
+                except FrameShapeError as e:
+                    print(f"[!] {e}; decoding the rest on one core")
+                    fallback_from = indices[0]
+                    break
+                except BrokenProcessPool:
+                    _discard_decode_pool(executor)
+                    raise
+                finally:
+                    in_flight_bytes -= len(indices) * frame_bytes
+                    shm.close()
+                    shm.unlink()
+                while submit_next():
+                    pass
+                yield from decoded
+                if count < len(indices):
+                    break
+        finally:
+            # The pool outlives this pass: drop the ranges nobody will read, and let
+            # the ones already decoding finish before their blocks are unlinked
+            for _, _, future in pending:
+                future.cancel()
+            wait([future for _, _, future in pending])
+            for _, shm, _ in pending:
+                shm.close()
+                shm.unlink()
+
+        if fallback_from is not None:
+            for frame_idx, frame in super()._iter_raw_frames(every_n_seconds, max_frames, decode_mode):
+                if frame_idx >= fallback_from:
+                    yield frame_idx, self._fit(frame)
+
+class PyAVVideoFrameSampler(VideoFrameSampler):
+    """
+    `VideoFrameSampler` that decodes with PyAV (FFmpeg's libraries) instead of OpenCV's
+    capture, so FFmpeg can do more of the work:
+
+    - Sampled frames are scaled to fit `max_side` and converted to BGR in one swscale
+      pass, instead of being converted at full resolution and resized later. Frames
+      that are not sampled are never converted.
+    - `keyframes_only` makes the decoder skip everything but keyframes, so a coarse scan
+      costs one decode per GOP. Each sample is then the first keyframe at or after its
+      sampling time, so samples can be further apart than `every_n_seconds`, and the
+      video is always read linearly whatever the decode mode.
+    - The decoder uses `threads` frame and slice threads (0: one per CPU).
+
+    Frame indices, timestamps and everything built on the raw frame stream work
+    unchanged. Without PyAV installed, or if PyAV can't open the file, frames are decoded
+    by OpenCV as in the base class (still resized to `max_side`, but every frame).
+
+    Args:
+        max_side (int): Longest side of decoded frames; None keeps the source size.
+            Anything above the encoder's `max_side` is downscaled before sending anyway.
+    """
+
+    def __init__(
+        self,
+        video_path: str | Path,
+        max_side: Optional[int] = None,
+        keyframes_only: bool = False,
+        threads: int = 0,
+        gop_size: Optional[int] = None,
+        encoder: Optional[FrameEncoder] = None,
+        frame_cache: Optional["FrameCache"] = None,
+        video_hash: Optional[str] = None,
+    ):
+        super().__init__(video_path, gop_size, encoder, frame_cache, video_hash)
+        self.max_side = max_side
+        self.keyframes_only = keyframes_only
+        self.threads = threads
+        self.backend: Literal["pyav", "cv2"] = "cv2"
+        self.start_time = 0.0
+        if av is None:
+            print("[!] PyAV is not installed; decoding with OpenCV")
+            return
+        try:
+            with av.open(self.video_path) as container:
+                stream = container.streams.video[0]
+                self.start_time = float(stream.start_time * stream.time_base) if stream.start_time is not None else 0.0
+            self.backend = "pyav"
+        except (av.FFmpegError, IndexError) as e:
+            print(f"[!] PyAV cannot decode {self.video_path} ({e}); decoding with OpenCV")
+
+    def decoder_params(self) -> dict:
+        params = {}
+        if self.max_side:
+            params["max_side"] = self.max_side
+        if self.keyframes_only and self.backend == "pyav":
+            params["keyframes_only"] = True
+        return params
+
+    def _frame_index(self, time_sec: float) -> int:
+        return round((time_sec - self.start_time) * self.fps)
+
+    def _to_bgr(self, frame: "av.VideoFrame") -> np.ndarray:
+        width, height = frame.width, frame.height
+        if self.max_side and max(width, height) > self.max_side:
+            scale = self.max_side / max(width, height)
+            width, height = max(1, round(width * scale)), max(1, round(height * scale))
+        frame_bgr = frame.to_ndarray(format="bgr24", width=width, height=height, interpolation="AREA")
+        # Phone videos are stored sideways with a rotation flag, which OpenCV applies.
+        # Older PyAV releases have no `rotation`; their frames are left as stored.
+        turns = round(getattr(frame, "rotation", 0) / 90) % 4
+        if turns:
+            frame_bgr = np.ascontiguousarray(np.rot90(frame_bgr, turns))
+        return frame_bgr
+
+    @cached_property
+    def keyframe_indices(self) -> list[int]:
+        """Frame index of every keyframe, read from the container without decoding anything."""
+        with av.open(self.video_path) as container:
+            stream = container.streams.video[0]
+            return [
+                self._frame_index(float(packet.pts * packet.time_base))
+                for packet in container.demux(stream)
+                if packet.is_keyframe and packet.pts is not None
+            ]
+
+    def planned_samples(self, every_n_seconds: float = 1.0, max_frames: int | None = None) -> int:
+        if not (self.keyframes_only and self.backend == "pyav"):
+            return super().planned_samples(every_n_seconds, max_frames)
+        interval = max(1, int(self.fps * every_n_seconds))
+        samples, next_idx = 0, 0
+        for frame_idx in self.keyframe_indices:
+            if frame_idx >= next_idx:
+                samples += 1
+                next_idx = frame_idx + interval
+        return samples if max_frames is None else min(samples, max_frames)
+
+    def _iter_keyframes(self, container: "av.container.InputContainer", interval: int) -> Iterator[tuple[int, "av.VideoFrame"]]:
+        next_idx = 0
+        for frame in container.decode(video=0):
+            if frame.time is None:
+                continue
+            frame_idx = self._frame_index(frame.time)
+            if frame_idx >= next_idx:
+                yield frame_idx, frame
+                next_idx = frame_idx + interval
+
+    def _iter_seek(self, container: "av.container.InputContainer", interval: int) -> Iterator[tuple[int, "av.VideoFrame"]]:
+        stream = container.streams.video[0]
+        for frame_idx in range(0, self.total_frames, interval):
+            target = (stream.start_time or 0) + int(frame_idx / self.fps / stream.time_base)
+            # Lands on the keyframe before the target; decode forward from there
+            container.seek(target, stream=stream, backward=True)
+            for frame in container.decode(stream):
+                if frame.time is not None and self._frame_index(frame.time) >= frame_idx:
+                    yield frame_idx, frame
+                    break
+            else:
+                return
+
+    def _iter_sequential(self, container: "av.container.InputContainer", interval: int) -> Iterator[tuple[int, "av.VideoFrame"]]:
+        # Counted like OpenCV's grab loop, so indices match the base class exactly
+        for frame_idx, frame in enumerate(container.decode(video=0)):
+            if frame_idx % interval == 0:
+                yield frame_idx, frame
+
+    def _iter_raw_frames(
+        self,
+        every_n_seconds: float = 1.0,
+        max_frames: int | None = None,
+        decode_mode: Literal["auto", "seek", "sequential"] = "auto",
+    ) -> Iterator[tuple[int, np.ndarray]]:
+        if self.backend != "pyav":
+            for frame_idx, frame in super()._iter_raw_frames(every_n_seconds, max_frames, decode_mode):
+                yield frame_idx, FrameEncoder._resize(frame, self.max_side) if self.max_side else frame
+            return
+
+        interval = max(1, int(self.fps * every_n_seconds))
+        if decode_mode == "auto":
+            decode_mode = self.choose_decode_mode(interval)
+        if decode_mode not in ("seek", "sequential"):
+            raise ValueError(f"Unsupported decode mode: {decode_mode}")
+
+        with metrics.stage("open"):
+            container = av.open(self.video_path)
+        try:
+            stream = container.streams.video[0]
+            stream.thread_type = "AUTO"
+            stream.thread_count = self.threads
+            if self.keyframes_only:
+                stream.codec_context.skip_frame = "NONKEY"
+                frames = self._iter_keyframes(container, interval)
+            elif decode_mode == "seek":
+                frames = self._iter_seek(container, interval)
+            else:
+                frames = self._iter_sequential(container, interval)
+
+            count = 0
+            # Each sampled frame is charged for the frames decoded (or skipped) before it
+            start = time.perf_counter()
+            for frame_idx, frame in frames:
+                if max_frames is not None and count >= max_frames:
+                    break
+                frame_bgr = self._to_bgr(frame)
+                metrics.record("decode", time.perf_counter() - start)
+                yield frame_idx, frame_bgr
+                start = time.perf_counter()
+                count += 1
+        finally:
+            container.close()
+
+class LiveFrameSampler(VideoFrameSampler):
+    """
+    Samples a live source: an RTSP/HTTP URL, a webcam index or a file that is still
+    being written. A reader thread grabs every frame so the source never backs up, but
+    only decodes one to BGR when `latest_frame` asks for it, so a consumer that falls
+    behind always gets the newest frame rather than a queue of stale ones.
+
+    Args:
+        follow (bool): For files: at the end, wait for more frames instead of stopping.
+        realtime (bool): For files: release frames at their playback time, so a
+            recording can stand in for a live source.
+        loop (bool): For files: start over at the end.
+        reconnect_seconds (float): Wait before reopening a stream that dropped, or before
+            checking a followed file for new frames.
+    """
+    default_fps: float = 30.0
+
+    def __init__(
+        self,
+        source: str | int,
+        encoder: Optional[FrameEncoder] = None,
+        follow: bool = False,
+        realtime: bool = False,
+        loop: bool = False,
+        reconnect_seconds: float = 2.0,
+    ):
+        # Read by `_open`, which the base class calls to open the source
+        self.source = source
+        self.is_stream = isinstance(source, int) or "://" in str(source)
+        # Live frames never repeat, so there is nothing to cache; there is no GOP to guess either
+        super().__init__(str(source), VideoFrameSampler.default_gop_size, encoder)
+        self.follow = follow
+        self.realtime = realtime
+        self.loop = loop
+        self.reconnect_seconds = reconnect_seconds
+        # Webcams and some streams report 0 or nonsense
+        if not 0 < self.fps <= 240:
+            self.fps = LiveFrameSampler.default_fps
+        # Unknown for live sources
+        self.total_frames = 0
+        self.frames_read = 0
+        self._cond = threading.Condition()
+        self._wanted = False
+        self._latest: Optional[tuple[float, float, np.ndarray]] = None
+        self._ended = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _open(self) -> cv2.VideoCapture:
+        cap = cv2.VideoCapture(self.source)
+        if self.is_stream:
+            # Keep the backend's own buffer short so grabbed frames are current
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return cap
+
+    @property
+    def ended(self) -> bool:
+        return self._ended
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._read_loop, name="live-reader", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        else:
+            self.cap.release()
+
+    def _read_loop(self):
+        cap = self.cap
+        started = time.monotonic()
+        # Added to file positions after each loop, so positions keep increasing
+        offset = 0.0
+        position = 0.0
+        try:
+            while not self._stop.is_set():
+                if not cap.grab():
+                    if self.is_stream or self.follow:
+                        resume_at = cap.get(cv2.CAP_PROP_POS_FRAMES)
+                        cap.release()
+                        if self._stop.wait(self.reconnect_seconds):
+                            break
+                        cap = self.cap = self._open()
+                        if not self.is_stream and resume_at > 0:
+                            cap.set(cv2.CAP_PROP_POS_FRAMES, resume_at)
+                        continue
+                    if self.loop and self.frames_read:
+                        offset = position + 1.0 / self.fps
+                        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                        continue
+                    break
+                self.frames_read += 1
+                if self.is_stream:
+                    position = time.monotonic() - started
+                else:
+                    position = offset + cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+                if self.realtime and self._stop.wait(max(0.0, started + position - time.monotonic())):
+                    break
+                with self._cond:
+                    if not self._wanted:
+                        continue
+                with metrics.stage("decode"):
+                    ret, frame = cap.retrieve()
+                if not ret:
+                    continue
+                with self._cond:
+                    self._latest = (round(position, 3), time.time(), frame)
+                    self._wanted = False
+                    self._cond.notify_all()
+        finally:
+            cap.release()
+            with self._cond:
+                self._ended = True
+                self._cond.notify_all()
+
+    def latest_frame(self, timeout: Optional[float] = None) -> Optional[tuple[float, float, np.ndarray]]:
+        """
+        The first frame grabbed after this call, as (position in seconds, wall-clock
+        capture time, BGR frame). None if the source ended or nothing arrived in `timeout`.
+        """
+        self.start()
+        with self._cond:
+            self._latest = None
+            self._wanted = True
+            self._cond.wait_for(lambda: self._latest is not None or self._ended, timeout)
+            frame, self._latest = self._latest, None
+            self._wanted = False
+            return frame